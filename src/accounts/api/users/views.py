@@ -93,8 +93,7 @@ class UserOwnFoundedProjectAPIView(ProjectAPIView):
         projects = user.founded_projects.all()
         project_status = self.request.GET.get("project_status", None)
         if project_status:
-            project_id = [x.id for x in projects if x.project_status == project_status]
-            return projects.filter(pk__in=project_id)
+            return projects.filter(status=project_status)
         return projects
 
     def post(self, request, *args, **kwargs):
@@ -0,0 +1,180 @@
+import os
+import csv
+import json
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from annotation.utils import get_filename_ext
+
+
+PACK_NAME = 'content.pack'
+
+
+class ContentCache(object):
+    """
+    Bounded in-process LRU cache of loaded content, optionally backed by one of
+    Django's caches (settings.CONTENT_CACHE_ALIAS) shared between workers.
+    """
+    def __init__(self, size, alias=None):
+        self.size = size
+        self.alias = alias
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def shared_key(self, key):
+        return 'content:' + hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+        if self.alias:
+            value = caches[self.alias].get(self.shared_key(key))
+            if value is not None:
+                self.set(key, value, shared=False)
+                with self.lock:
+                    self.hits += 1
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value, shared=True):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        if shared and self.alias:
+            caches[self.alias].set(self.shared_key(key), value)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.items)}
+
+
+cache = ContentCache(settings.CONTENT_CACHE_SIZE, settings.CONTENT_CACHE_ALIAS)
+
+
+class PackWriter(object):
+    """
+    Append JSON records to a pack file, one per line. `append` returns the
+    (offset, length) of the record, which is all a reader needs to fetch it again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'ab')
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def append(self, record):
+        data = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        offset = self.file.tell()
+        self.file.write(data + b'\n')
+        return offset, len(data)
+
+
+# Open pack mappings by path, least recently used first. Each holds a file descriptor,
+# so only the MAX_OPEN_PACKS most recently read packs stay mapped.
+MAX_OPEN_PACKS = 64
+
+_maps = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def _read_map(path, mtime, offset, length):
+    # Packs only grow, so a mapping is reused until a read falls past its end or the
+    # file changes. Slicing under the lock keeps an eviction from closing it mid-read.
+    with _maps_lock:
+        mapped, mapped_mtime = _maps.pop(path, (None, None))
+        if mapped is None or mapped_mtime != mtime or len(mapped) < offset + length:
+            if mapped is not None:
+                mapped.close()
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _maps[path] = (mapped, mtime)
+        while len(_maps) > MAX_OPEN_PACKS:
+            evicted = _maps.popitem(last=False)[1][0]
+            evicted.close()
+        return mapped[offset:offset + length]
+
+
+def read_packed(path, offset, length, mtime=None):
+    if mtime is None:
+        mtime = os.stat(path).st_mtime_ns
+    data = _read_map(path, mtime, offset, length)
+    return json.loads(data.decode('utf-8'), object_pairs_hook=OrderedDict)
+
+
+def read_file(path):
+    name, ext = get_filename_ext(path)
+    if ext == '.csv':
+        with open(path, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                return row
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def _load(path, mtime, offset, length):
+    key = (path, mtime, offset)
+    content = cache.get(key)
+    if content is None:
+        if offset is not None:
+            content = read_packed(path, offset, length, mtime)
+        else:
+            content = read_file(path)
+        cache.set(key, content)
+    # Rows are dicts that callers may extend, never hand out the cached one.
+    if isinstance(content, dict):
+        return OrderedDict(content)
+    return content
+
+
+def load_content(path, offset=None, length=None):
+    """
+    Content of one item: a slice of a pack when `offset` is given, otherwise the
+    first row of a CSV file or the text of any other file. Results are cached by
+    path, modification time and offset, so a rewritten file is read again.
+    """
+    return _load(path, os.stat(path).st_mtime_ns, offset, length)
+
+
+def load_contents(keys):
+    """
+    Content of many (path, offset, length) items, in order. Each file is statted
+    once and packs are read in offset order.
+    """
+    mtimes = {}
+    contents = [None] * len(keys)
+    for i in sorted(range(len(keys)), key=lambda i: (keys[i][0], keys[i][1] or 0)):
+        path, offset, length = keys[i]
+        if path not in mtimes:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        contents[i] = _load(path, mtimes[path], offset, length)
+    return contents
+
+
+def pack_path(directory):
+    return os.path.join(directory, PACK_NAME)
@@ -0,0 +1,22 @@
+from django.utils.http import urlencode
+from rest_framework import serializers
+from rest_framework.reverse import reverse as api_reverse
+
+
+class ProtectedFileField(serializers.FileField):
+    """
+    File field that accepts uploads as usual but renders the authenticated download
+    endpoint `view_name` of the owning object instead of the raw storage URL.
+    """
+    def __init__(self, view_name, query=None, **kwargs):
+        self.view_name = view_name
+        self.query = query
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = api_reverse(self.view_name, kwargs={'id': value.instance.id}, request=self.context.get('request'))
+        if self.query:
+            url += '?' + urlencode(self.query)
+        return url
@@ -1,6 +1,140 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor
 
 
 class RESTAPIPagination(pagination.LimitOffsetPagination):
     default_limit = 10
     max_limit = 20
+
+
+class RESTAPICursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination: a page continues strictly after the (ordering field, id) of the last row
+    of the previous one, so ties on the ordering field never repeat or skip rows, and no COUNT
+    is run. NULLs sort after every value in both directions. Only the first ordering field is used.
+    """
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 20
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        return (list(ordering or [self.ordering])[0],)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field = self.ordering[0].lstrip('-')
+        self.descending = self.ordering[0].startswith('-')
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        key = self.decode_key(queryset.model)
+
+        queryset = queryset.order_by(*self.order_by(reverse))
+        if key is not None:
+            queryset = queryset.filter(self.seek(key, reverse))
+        rows = list(queryset[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, key is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def order_by(self, reverse):
+        """
+        Ordering of the page query: the field with NULLs last, then id in the same direction, all flipped when paging back.
+        """
+        descending = self.descending != reverse
+        if self.field == 'id':
+            return ['-id' if descending else 'id']
+        field = F(self.field).desc if descending else F(self.field).asc
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        return [field(**nulls), '-id' if descending else 'id']
+
+    def seek(self, key, reverse):
+        """
+        Rows strictly after (or, paging back, strictly before) the row `key` = (value, id).
+        """
+        value, pk = key
+        increasing = self.descending == reverse
+        id_after = Q(id__gt=pk) if increasing else Q(id__lt=pk)
+        if self.field == 'id':
+            return id_after
+        beyond = '%s__%s' % (self.field, 'gt' if increasing else 'lt')
+        isnull = '%s__isnull' % self.field
+        if value is None:
+            # NULLs come last: only later NULLs follow, every non-NULL row precedes.
+            if reverse:
+                return Q(**{isnull: False}) | (Q(**{isnull: True}) & id_after)
+            return Q(**{isnull: True}) & id_after
+        after = Q(**{beyond: value}) | Q(**{self.field: value}) & id_after
+        if reverse:
+            return after
+        return after | Q(**{isnull: True})
+
+    def decode_key(self, model):
+        if self.cursor is None or not self.cursor.position:
+            return None
+        try:
+            value, pk = json.loads(self.cursor.position)
+            if value is not None:
+                value = model._meta.get_field(self.field).to_python(value)
+            return value, int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_key(self, row, reverse):
+        value = getattr(row, self.field)
+        position = json.dumps([None if value is None else str(value), row.pk])
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_key(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_key(self.page[0], reverse=True)
+
+
+class OptionalCursorPagination(RESTAPIPagination):
+    """
+    Limit/offset pagination unless the request carries ?cursor= (empty for the first page),
+    which switches to RESTAPICursorPagination and follows its next/previous links.
+    """
+    cursor_query_param = 'cursor'
+    cursor_class = RESTAPICursorPagination
+    cursor = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor = self.cursor_class()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,36 @@
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+
+
+def protected_location(path):
+    """
+    The internal nginx location serving `path`, or None if it is under none of settings.PROTECTED_ROOTS.
+    """
+    path = os.path.realpath(path)
+    for root, prefix in settings.PROTECTED_ROOTS:
+        root = os.path.realpath(root)
+        if os.path.commonpath([path, root]) == root:
+            return prefix + quote(os.path.relpath(path, root))
+    return None
+
+
+def send_file(path, filename=None):
+    """
+    Download response for a file the view has already authorized. Behind nginx the bytes,
+    Range requests included, are served by nginx through X-Accel-Redirect.
+    """
+    location = protected_location(path)
+    if location is None or not os.path.isfile(path):
+        raise Http404
+    if settings.USE_X_ACCEL_REDIRECT:
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = location
+        # Let nginx pick the type from the file extension.
+        del response['Content-Type']
+    else:
+        response = FileResponse(open(path, 'rb'))
+    response['Content-Disposition'] = "attachment; filename*=UTF-8''%s" % quote(filename or os.path.basename(path))
+    return response
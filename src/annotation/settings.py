@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 import os
 import pymysql
 import djcelery
+from datetime import timedelta
 
 from annotation.restconf.main import *
 
@@ -25,8 +26,20 @@ CELERY_RESULT_BACKEND = 'djcelery.backends.database:DatabaseBackend'
 
 CELERY_IMPORTS = (
     'tasks.tasks',
+    'grades.tasks',
 )
 
+CELERYBEAT_SCHEDULE = {
+    'finalize-submissions': {
+        'task': 'tasks.tasks.finalize_submissions',
+        'schedule': timedelta(seconds=5),
+    },
+    'release-expired-leases': {
+        'task': 'tasks.tasks.release_expired_leases',
+        'schedule': timedelta(minutes=1),
+    },
+}
+
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -174,6 +187,36 @@ RESULT_URL = 'http://10.1.62.101/result/'
 
 RESULT_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'result')
 
+# Authorized downloads are handed to nginx with X-Accel-Redirect, each root mapped to an internal location.
+# Only the nginx deployment (docker-compose) turns it on; without nginx in front Django serves the file itself.
+
+USE_X_ACCEL_REDIRECT = os.environ.get('USE_X_ACCEL_REDIRECT') == 'true'
+
+PROTECTED_ROOTS = [
+    (RESULT_ROOT, '/protected/result/'),
+    (MEDIA_ROOT, '/protected/media/'),
+]
+
+
+# Seconds a checked out contribution stays reserved for its annotator
+
+CONTRIBUTION_LEASE_SECONDS = 600
+
+# Seconds a label can still be changed before it is submitted
+
+SUBMIT_GRACE_SECONDS = 5
+
+# Seconds without progress after which a pending or running background job is treated as lost
+
+JOB_STALE_SECONDS = 3600
+
+
+# Task content cache: entries kept per process, and an optional Django cache alias shared between workers
+
+CONTENT_CACHE_SIZE = 4096
+
+CONTENT_CACHE_ALIAS = None
+
 
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
@@ -16,6 +16,22 @@ def get_filename_ext(filepath):
     return name, ext
 
 
+class CounterFieldsMixin(object):
+    """
+    Model mixin for counters that are only changed through F() updates: saving an existing
+    row writes every field except `counter_fields`, so a stale copy never overwrites them.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if self.pk and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
 def random_string_generator(size=10, chars=string.ascii_lowercase + string.digits):
     return ''.join(random.choice(chars) for _ in xrange(size))
 
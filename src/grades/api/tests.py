@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from grades.models import Grade, update_grades
+from projects.models import Project, Status
+from quizzes.models import QuestionType
+from targets.models import Target, TargetType
+from tags.models import Tag
+from tasks.models import Task, Contribution
+
+
+User = get_user_model()
+
+
+class UpdateGradesTestCase(APITestCase):
+    def setUp(self):
+        founder = User.objects.create(email='founder@gmail.com', full_name='founder')
+        self.users = [User.objects.create(email='user_%d@gmail.com' % i, full_name='user_%d' % i) for i in range(2)]
+        target_type = TargetType.objects.create(name='Classification', chinese_name='分类')
+        question_type = QuestionType.objects.create(name='TextClassification', chinese_name='文本分类', type=target_type)
+        target = Target.objects.create(user=founder, name='sentiment', type=target_type, description='')
+        Status.objects.create(
+            id=1,
+            project_status='answering',
+            project_status_name='进行中',
+            verify_status='passed',
+            verify_status_name='审核通过',
+        )
+        self.project = Project.objects.create(
+            project_type=question_type,
+            founder=founder,
+            project_target=target,
+            status=Status(pk='answering'),
+        )
+        self.tags = [Tag.objects.create(name=name, founder=founder) for name in ['news', 'review']]
+        self.project.tags.add(*self.tags)
+
+    def test_update_grades_counts_good_labels_per_user_and_tag(self):
+        # user_0 agrees with both final labels, user_1 with one of them.
+        answers = [('positive', ['positive', 'positive']), ('negative', ['negative', 'positive'])]
+        for i, (final, labels) in enumerate(answers):
+            task = Task.objects.create(project=self.project, file_path='%d.txt' % i, copy=2, label=final)
+            for user, label in zip(self.users, labels):
+                Contribution.objects.create(project=self.project, task=task, contributor=user, label=label)
+        Contribution.objects.create(project=self.project, task=task)
+
+        update_grades(self.project.id)
+        update_grades(self.project.id)
+        grades = Grade.objects.filter(project=self.project).values_list('user', 'tag', 'labels', 'good_labels')
+        self.assertEqual(sorted(grades), sorted(
+            (user.id, tag.id, 2, good)
+            for user, good in zip(self.users, [2, 1]) for tag in self.tags
+        ))
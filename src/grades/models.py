@@ -1,10 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, When
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.contrib.auth import get_user_model
 
 from projects.models import Project
 from tags.models import Tag
+from tasks.models import Contribution
+from grades.tasks import compute_grades
 
 
 User = get_user_model()
@@ -22,25 +25,34 @@ class Grade(models.Model):
         return str(self.id) + '_Project' + str(self.project.id) + '_' + self.user.full_name + '_' + self.tag.name
 
 
+def update_grades(project_id):
+    """
+    Replace the grades of a project: labels and good labels per contributor come from one
+    GROUP BY over contributions joined to their tasks, and one grade per tag is bulk inserted.
+    """
+    scores = Contribution.objects.filter(
+        project_id=project_id, contributor__isnull=False
+    ).order_by().values('contributor').annotate(
+        labels=Count('id'),
+        good_labels=Sum(Case(When(label=F('task__label'), then=1), default=0, output_field=IntegerField())),
+    )
+    tag_ids = list(Tag.objects.filter(tagged_projects=project_id).values_list('id', flat=True))
+    grades = [
+        Grade(
+            project_id=project_id,
+            user_id=score['contributor'],
+            tag_id=tag_id,
+            labels=score['labels'],
+            good_labels=score['good_labels'],
+        )
+        for score in scores for tag_id in tag_ids
+    ]
+    with transaction.atomic():
+        Grade.objects.filter(project_id=project_id).delete()
+        Grade.objects.bulk_create(grades)
+
+
 @receiver(post_save, sender=Project)
-def receiver(sender, instance, *args, **kwargs):    
-    if instance.project_status == 'completed':
-        old_grade_set = Grade.objects.filter(project=instance)
-        if old_grade_set:
-            old_grade_set.delete()
-        contribution_set = instance.contribution_set.all()
-        contributors = set(contribution_set.values_list('contributor', flat=True))
-        for user in contributors:
-            user_done_set = contribution_set.filter(contributor=user)
-            labels = user_done_set.count()
-            good_labels = 0
-            for contribution in user_done_set:
-                if contribution.label == contribution.task.label:
-                    good_labels += 1
-
-            for tag in instance.tags.all():
-                Grade.objects.create(project=instance,
-                                     user_id=user,
-                                     tag=tag,
-                                     labels=labels,
-                                     good_labels=good_labels)
+def project_completed_receiver(sender, instance, *args, **kwargs):
+    if instance.status_id == 'completed':
+        transaction.on_commit(lambda: compute_grades.delay(instance.id))
@@ -0,0 +1,7 @@
+from celery import task
+
+
+@task(name='grades.tasks.compute_grades')
+def compute_grades(project_id):
+    from grades.models import update_grades
+    update_grades(project_id)
@@ -1,11 +1,15 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse as api_reverse
 
-from projects.models import Project
+from annotation.restconf.fields import ProtectedFileField
+from projects.models import Project, parse_contributor_ids, unknown_user_ids
+from tasks.models import Job
 from targets.api.serializers import TargetSerializer
 from tags.api.serializers import TagBriefSerializer
 
 
+MAX_BULK_CONTRIBUTORS = 1000
+
 VERIFY_CHOICE = (
     ('passed', '审核通过'),
     ('failed', '审核不通过'),
@@ -23,6 +27,7 @@ class ProjectSerializer(serializers.ModelSerializer):
     target = serializers.SerializerMethodField(read_only=True)
     is_in = serializers.SerializerMethodField(read_only=True)
     my_quantity = serializers.SerializerMethodField(read_only=True)
+    project_file = ProtectedFileField('api-projects:project-file', required=False, allow_null=True)
 
     class Meta:
         model = Project
@@ -62,6 +67,20 @@ class ProjectSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("No more than three tags.")
         return value
 
+    def validate_contributors_char(self, value):
+        unknown = unknown_user_ids(parse_contributor_ids(value))
+        if unknown:
+            raise serializers.ValidationError("Unknown user ids: %s." % ', '.join(str(user_id) for user_id in unknown))
+        return value
+
+    def validate_project_file(self, value):
+        # A new file deletes the current tasks, which an ingest still in flight would keep inserting.
+        if value and self.instance is not None and Job.objects.active().filter(
+            project=self.instance, kind='ingest'
+        ).exists():
+            raise serializers.ValidationError("Tasks are still being imported from the current file.")
+        return value
+
     def validate_repetition_rate(self, value):
         if value > 2 and value != int(value):
             raise serializers.ValidationError("Repetition rate should be integer if it is greater than 2.")
@@ -120,11 +139,15 @@ class ProjectSerializer(serializers.ModelSerializer):
         return TargetSerializer(target).data
 
     def get_is_in(self, obj):
+        if hasattr(obj, 'is_in'):
+            return obj.is_in
         request = self.context.get('request')
         user_id = request.user.id
         return obj.contributors.filter(id=user_id).exists()
 
     def get_my_quantity(self, obj):
+        if hasattr(obj, 'my_quantity'):
+            return obj.my_quantity
         request = self.context.get('request')
         user = request.user
         if obj.quantity != 0:
@@ -182,6 +205,7 @@ class ProjectReleaseSerializer(ProjectSerializer):
 
 class ProjectInlineVerifySerializer(ProjectSerializer):
     verify_status = serializers.ChoiceField(default='passed', choices=VERIFY_CHOICE)
+    project_file = ProtectedFileField('api-projects:project-file', read_only=True)
 
     class Meta:
         model = Project
@@ -210,6 +234,8 @@ class ProjectTargetSerializer(ProjectSerializer):
 
 
 class ProjectResultURLSerializer(ProjectSerializer):
+    result_file = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = Project
         fields = [
@@ -217,3 +243,22 @@ class ProjectResultURLSerializer(ProjectSerializer):
             'quantity',
             'result_file',
         ]
+
+    def get_result_file(self, obj):
+        if not obj.result_file:
+            return None
+        request = self.context.get('request')
+        return api_reverse('api-projects:result-file', kwargs={'id': obj.id}, request=request)
+
+
+class BulkContributorsSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    emails = serializers.ListField(child=serializers.EmailField(), required=False, default=list)
+
+    def validate(self, data):
+        count = len(data['user_ids']) + len(data['emails'])
+        if count == 0:
+            raise serializers.ValidationError("Give at least one user id or email.")
+        if count > MAX_BULK_CONTRIBUTORS:
+            raise serializers.ValidationError("No more than %d users at a time." % MAX_BULK_CONTRIBUTORS)
+        return data
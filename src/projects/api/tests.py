@@ -0,0 +1,365 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.reverse import reverse as api_reverse
+
+from projects.models import Project, Status, parse_contributor_ids
+from projects.api.serializers import ProjectSerializer
+from quizzes.models import QuestionType
+from targets.models import Target, TargetType
+from tags.models import Tag
+from tasks.models import Task, Contribution, Job
+from tasks.export import csv_row
+
+
+User = get_user_model()
+
+
+class ProjectAPITestCase(APITestCase):
+    def setUp(self):
+        self.founder = User.objects.create(email='founder@gmail.com', full_name='founder')
+        self.user = User.objects.create(email='user@gmail.com', full_name='user')
+        target_type = TargetType.objects.create(name='Classification', chinese_name='分类')
+        self.question_type = QuestionType.objects.create(
+            name='TextClassification', chinese_name='文本分类', type=target_type
+        )
+        self.target = Target.objects.create(user=self.founder, name='sentiment', type=target_type, description='')
+        self.tag = Tag.objects.create(name='news', founder=self.founder)
+        Status.objects.create(
+            id=1,
+            project_status='answering',
+            project_status_name='进行中',
+            verify_status='passed',
+            verify_status_name='审核通过',
+        )
+
+
+class ProjectListAPITestCase(ProjectAPITestCase):
+    def create_projects(self, count):
+        for i in range(count):
+            project = Project.objects.create(
+                project_type=self.question_type,
+                founder=self.founder,
+                project_target=self.target,
+                status=Status(pk='answering'),
+                contributors_char=str(self.user.id),
+            )
+            project.tags.add(self.tag)
+            task = Task.objects.create(project=project, file_path='%d.txt' % i, copy=1)
+            Contribution.objects.create(project=project, task=task, contributor=self.user, label='positive')
+            project.rebuild_counters()
+
+    def list_queries(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(api_reverse('api-projects:list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_list_query_count_does_not_grow_with_page(self):
+        self.create_projects(2)
+        response, small = self.list_queries()
+        self.create_projects(5)
+        response, large = self.list_queries()
+        self.assertEqual(small, large)
+
+        project = response.data['results'][0]
+        self.assertTrue(project['is_in'])
+        self.assertEqual(project['my_quantity'], 1)
+        self.assertEqual(project['quantity'], 1)
+        self.assertEqual(project['target']['type_name'], 'Classification')
+        self.assertEqual(project['tags_detail'][0]['name'], 'news')
+
+
+class ProjectResultAPITestCase(ProjectAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(
+            project_type=self.question_type,
+            founder=self.founder,
+            project_target=self.target,
+            status=Status(pk='answering'),
+        )
+        self.media_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_dir)
+
+    def create_results(self, count):
+        for i in range(Task.objects.count(), Task.objects.count() + count):
+            file_path = os.path.join(self.media_dir, '%d.txt' % i)
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write('text')
+            task = Task.objects.create(project=self.project, file_path=file_path, copy=1, label='positive')
+            Contribution.objects.create(project=self.project, task=task, contributor=self.user, label='positive')
+
+    def result_queries(self):
+        self.client.force_authenticate(self.founder)
+        result_url = api_reverse('api-projects:result', kwargs={'id': self.project.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(result_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_result_query_count_does_not_grow_with_page(self):
+        self.create_results(2)
+        response, small = self.result_queries()
+        self.create_results(5)
+        response, large = self.result_queries()
+        self.assertEqual(small, large)
+
+        task = response.data['results'][0]
+        self.assertEqual(task['text_content'], 'text')
+        self.assertIsNone(task['inspection'])
+        self.assertEqual(task['contribution'][0]['contributor_name'], 'user')
+
+    def test_result_cursor_pages_cover_every_task(self):
+        self.create_results(5)
+        self.client.force_authenticate(self.founder)
+        url = api_reverse('api-projects:result', kwargs={'id': self.project.id}) + '?cursor=&limit=2'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(task['id'] for task in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, sorted(self.project.task_set.values_list('id', flat=True)))
+
+    def test_result_cursor_pages_through_tied_values(self):
+        self.create_results(5)
+        self.project.task_set.update(updated=timezone.now())
+        self.client.force_authenticate(self.founder)
+        url = api_reverse('api-projects:result', kwargs={'id': self.project.id}) + '?cursor=&limit=2&ordering=-updated'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            ids.extend(task['id'] for task in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, sorted(self.project.task_set.values_list('id', flat=True), reverse=True))
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([task['id'] for task in response.data['results']], ids[2:4])
+
+    def test_download_result_streams_csv(self):
+        self.create_results(3)
+        Status.objects.create(
+            id=2,
+            project_status='completed',
+            project_status_name='已完成',
+            verify_status='passed',
+            verify_status_name='审核通过',
+        )
+        Project.objects.filter(id=self.project.id).update(status='completed')
+        self.client.force_authenticate(self.founder)
+        download_url = api_reverse('api-projects:download-result', kwargs={'id': self.project.id})
+        response = self.client.get(download_url + '?stream=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'task_id,content_text,label,contributor_labels,inspection_label')
+        self.assertEqual(len(lines), 4)
+
+        response = self.client.get(download_url, {'export_format': 'jsonl.gz'})
+        records = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        record = json.loads(records[0])
+        self.assertEqual(record['content'], 'text')
+        self.assertEqual(record['contributor_labels'], {str(self.user.id): 'positive'})
+        self.assertEqual(record['inspection_label'], '')
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(download_url + '?stream=true')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(None)
+        response = self.client.get(download_url + '?stream=true')
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    def test_csv_row_keeps_content_apart_from_result_columns(self):
+        record = {
+            'task_id': 1,
+            'content': {'task_id': '7', 'label': 'raw'},
+            'label': 'positive',
+            'contributor_labels': {},
+            'inspection_label': '',
+        }
+        row = csv_row(record)
+        self.assertEqual((row['task_id'], row['label']), (1, 'positive'))
+        self.assertEqual((row['content_task_id'], row['content_label']), ('7', 'raw'))
+
+    def test_result_delta_follows_watermark(self):
+        self.create_results(3)
+        earlier = timezone.now() - timedelta(minutes=2)
+        self.project.task_set.update(updated=earlier)
+        self.client.force_authenticate(self.founder)
+        delta_url = api_reverse('api-projects:result-delta', kwargs={'id': self.project.id})
+
+        response = self.client.get(delta_url, {'limit': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(response.data['more'])
+        response = self.client.get(delta_url, {'since': response.data['watermark']})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse(response.data['more'])
+
+        relabelled = self.project.task_set.first()
+        self.project.task_set.filter(id=relabelled.id).update(label='negative', updated=earlier + timedelta(minutes=1))
+        response = self.client.get(delta_url, {'since': response.data['watermark']})
+        self.assertEqual([task['task_id'] for task in response.data['results']], [relabelled.id])
+        self.assertEqual(response.data['results'][0]['label'], 'negative')
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(delta_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_task_file_is_handed_to_nginx(self):
+        self.create_results(1)
+        task = self.project.task_set.get()
+        file_url = api_reverse('api-tasks:file', kwargs={'id': task.id})
+        with override_settings(USE_X_ACCEL_REDIRECT=True, PROTECTED_ROOTS=[(self.media_dir, '/protected/media/')]):
+            self.client.force_authenticate(self.user)
+            response = self.client.get(file_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected/media/0.txt')
+            self.client.force_authenticate(User.objects.create(email='other@gmail.com', full_name='other'))
+            response = self.client.get(file_url)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ProjectIngestTestCase(ProjectAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(
+            project_type=self.question_type,
+            founder=self.founder,
+            project_target=self.target,
+            status=Status(pk='answering'),
+        )
+        self.job = Job.objects.create(project=self.project, kind='ingest', status='running')
+
+    def test_file_change_is_refused_while_ingesting(self):
+        upload = SimpleUploadedFile('tasks.csv', b'id,text\n1,text\n')
+        serializer = ProjectSerializer(self.project, data={'project_file': upload}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('project_file', serializer.errors)
+
+        Job.objects.filter(id=self.job.id).update(updated=timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS))
+        upload = SimpleUploadedFile('tasks.csv', b'id,text\n1,text\n')
+        self.assertEqual(ProjectSerializer(self.project).validate_project_file(upload), upload)
+
+    def test_release_waits_for_ingest_and_restarts_a_lost_one(self):
+        for i, name in enumerate(['unreleased', 'verifying'], 2):
+            Status.objects.create(
+                id=i, project_status=name, project_status_name=name, verify_status='', verify_status_name=''
+            )
+        Project.objects.filter(id=self.project.id).update(status='unreleased', project_file='upload.csv')
+        release_url = api_reverse('api-projects:release', kwargs={'id': self.project.id})
+        self.client.force_authenticate(self.founder)
+
+        response = self.client.put(release_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        Task.objects.create(project=self.project, file_path='0.txt', copy=1)
+        Job.objects.filter(id=self.job.id).update(
+            status='pending', updated=timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+        )
+        media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_dir)
+        with override_settings(MEDIA_ROOT=media_dir):
+            response = self.client.put(release_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.job.refresh_from_db()
+        self.assertFalse(self.job.is_stale)
+        self.assertFalse(self.project.task_set.exists())
+
+        Job.objects.filter(id=self.job.id).update(status='finished')
+        response = self.client.put(release_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Project.objects.get(id=self.project.id).status_id, 'verifying')
+
+    def test_project_file_links_to_the_authenticated_download(self):
+        Project.objects.filter(id=self.project.id).update(project_file='upload.csv')
+        self.client.force_authenticate(self.founder)
+        response = self.client.get(api_reverse('api-projects:detail', kwargs={'id': self.project.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        file_url = api_reverse('api-projects:project-file', kwargs={'id': self.project.id})
+        self.assertTrue(response.data['project_file'].endswith(file_url))
+
+    def test_ingest_progress_is_owner_only(self):
+        ingest_url = api_reverse('api-projects:ingest', kwargs={'id': self.project.id})
+        self.client.force_authenticate(self.user)
+        response = self.client.get(ingest_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(self.founder)
+        response = self.client.get(ingest_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'running')
+
+
+class ProjectContributorsTestCase(ProjectAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.others = [User.objects.create(email='other_%d@gmail.com' % i, full_name='other') for i in range(3)]
+        self.project = Project.objects.create(
+            project_type=self.question_type,
+            founder=self.founder,
+            project_target=self.target,
+            status=Status(pk='answering'),
+            contributors_char='%d,%d' % (self.user.id, self.others[0].id),
+        )
+
+    def test_contributors_follow_contributors_char(self):
+        project = Project.objects.get(id=self.project.id)
+        project.contributors_char = '%d,%d,%d' % (self.others[0].id, self.others[1].id, self.others[2].id)
+        project.save()
+        self.assertEqual(
+            set(project.contributors.values_list('id', flat=True)),
+            set(other.id for other in self.others),
+        )
+
+    def test_unrelated_save_leaves_contributors_alone(self):
+        project = Project.objects.get(id=self.project.id)
+        project.description = 'edited'
+        with CaptureQueriesContext(connection) as queries:
+            project.save()
+        through_table = Project.contributors.through._meta.db_table
+        self.assertFalse([query for query in queries.captured_queries if through_table in query['sql']])
+        self.assertEqual(project.contributors.count(), 2)
+
+    def test_bulk_contributor_endpoints_report_each_user(self):
+        self.client.force_authenticate(self.founder)
+        add_url = api_reverse('api-projects:bulk-add-contributors', kwargs={'id': self.project.id})
+        data = {'user_ids': [self.user.id, self.others[1].id, 0], 'emails': [self.others[2].email.upper()]}
+        response = self.client.post(add_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['already_in', 'added', 'not_found', 'added'],
+        )
+        self.assertEqual(self.project.contributors.count(), 4)
+        project = Project.objects.get(id=self.project.id)
+        project.update_contributors()
+        self.assertEqual(
+            set(parse_contributor_ids(project.contributors_char)),
+            set(project.contributors.values_list('id', flat=True)),
+        )
+        self.assertEqual(project.contributors.count(), 4)
+
+        remove_url = api_reverse('api-projects:bulk-remove-contributors', kwargs={'id': self.project.id})
+        response = self.client.post(remove_url, {'emails': [self.user.email, 'nobody@gmail.com']}, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], ['removed', 'not_found'])
+        self.assertEqual(self.project.contributors.count(), 3)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(add_url, {'user_ids': [self.user.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
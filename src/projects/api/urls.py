@@ -4,9 +4,15 @@ from .views import (
     ProjectAPIView,
     ProjectAPIDetailView,
     ProjectReleaseView,
+    ProjectIngestView,
+    ProjectExportView,
+    ProjectResultDeltaView,
+    ProjectResultFileView,
+    ProjectFileView,
     ContributorsListView,
     ProjectAddContributorsView,
     ProjectDeleteContributorsView,
+    ProjectBulkContributorsView,
     ProjectVerifyListView,
     ProjectVerifyDetailView,
     ProjectTargetDetailView,
@@ -22,13 +28,21 @@ urlpatterns = [
     url(r'^(?P<id>\d+)/$', ProjectAPIDetailView.as_view(), name='detail'),
     url(r'^(?P<id>\d+)/target/$', ProjectTargetDetailView.as_view(), name='target'),
     url(r'^(?P<id>\d+)/release/$', ProjectReleaseView.as_view(), name='release'),
+    url(r'^(?P<id>\d+)/ingest/$', ProjectIngestView.as_view(), name='ingest'),
     url(r'^(?P<id>\d+)/contributors/$', ContributorsListView.as_view(), name='contributors'),
     url(r'^(?P<id>\d+)/add_contributors/$', ProjectAddContributorsView.as_view(), name='add-contributors'),
     url(r'^(?P<id>\d+)/delete_contributors/$', ProjectDeleteContributorsView.as_view(), name='delete-contributors'),
+    url(r'^(?P<id>\d+)/contributors/bulk_add/$', ProjectBulkContributorsView.as_view(), name='bulk-add-contributors'),
+    url(r'^(?P<id>\d+)/contributors/bulk_remove/$', ProjectBulkContributorsView.as_view(remove=True),
+        name='bulk-remove-contributors'),
     url(r'^verify/$', ProjectVerifyListView.as_view(), name='verify-projects-list'),
     url(r'^(?P<id>\d+)/verify/$', ProjectVerifyDetailView.as_view(), name='verify-projects-detail'),
     url(r'^(?P<id>\d+)/result/$', ProjectResultView.as_view(), name='result'),
     url(r'^(?P<id>\d+)/my_contribution/$', ProjectMyContributionView.as_view(), name='my-contribution'),
     url(r'^(?P<id>\d+)/my_inspection/$', ProjectMyInspectionView.as_view(), name='my-inspection'),
     url(r'^(?P<id>\d+)/download_result/$', ProjectResultDownloadView.as_view(), name='download-result'),
+    url(r'^(?P<id>\d+)/export/$', ProjectExportView.as_view(), name='export'),
+    url(r'^(?P<id>\d+)/result_delta/$', ProjectResultDeltaView.as_view(), name='result-delta'),
+    url(r'^(?P<id>\d+)/result_file/$', ProjectResultFileView.as_view(), name='result-file'),
+    url(r'^(?P<id>\d+)/project_file/$', ProjectFileView.as_view(), name='project-file'),
 ]
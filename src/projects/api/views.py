@@ -1,10 +1,8 @@
-import os
-import csv
-
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
-from django.conf import settings
-from django.core.files.base import ContentFile
+from django.db.models import Prefetch, Q
+from django.db.models.functions import Lower
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import generics, mixins, permissions
 
@@ -16,20 +14,46 @@ from .serializers import (
     ProjectTargetSerializer,
     ProjectReleaseSerializer,
     ProjectResultURLSerializer,
+    BulkContributorsSerializer,
+)
+from tasks.models import Contribution, Job, attach_contents, requeue_ingest
+from tasks.export import (
+    EXPORT_FORMATS,
+    export_stream,
+    start_export,
+    result_record,
+    changed_since,
+    EXPORT_CHUNK_SIZE,
+    format_watermark,
+    parse_watermark,
 )
 from tasks.api.serializers import (
     TaskResultSerializer,
     ContributeResultSerializer,
     InspectResultSerializer,
+    JobSerializer,
 )
-from accounts.api.permissions import IsOwnerOrReadOnly, IsStaff
+from accounts.api.permissions import IsOwnerOrReadOnly, IsOwner, IsStaff
+from annotation.sendfile import send_file
+from annotation.restconf.pagination import OptionalCursorPagination
 from accounts.api.users.serializers import UserInlineSerializer, EditContributorsSerializer
 
 
 User = get_user_model()
 
 
-class ProjectAPIView(mixins.CreateModelMixin, generics.ListAPIView):
+class ProjectListingMixin(object):
+    """
+    Eager-load what ProjectSerializer renders, so a page costs the same number of queries whatever its size.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = queryset.for_listing(self.request.user)
+        return queryset
+
+
+class ProjectAPIView(ProjectListingMixin, mixins.CreateModelMixin, generics.ListAPIView):
     """
     get:
         【任务管理】 获取所有状态为“进行中”的公有任务列表
@@ -53,7 +77,7 @@ class ProjectAPIView(mixins.CreateModelMixin, generics.ListAPIView):
         serializer.save(founder=self.request.user)
 
 
-class ProjectAPIDetailView(mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.RetrieveAPIView):
+class ProjectAPIDetailView(ProjectListingMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.RetrieveAPIView):
     """
     get:
         【任务管理】or【任务广场】 获取任务详情
@@ -104,6 +128,7 @@ class ProjectReleaseView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
 
     put:
         【任务管理】 发布任务（只有状态为未发布和未通过的任务可以进行发布操作）
+            任务文件导入完成后才能发布；导入任务超过 JOB_STALE_SECONDS 没有进展时视为丢失，会被重新导入
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
     serializer_class = ProjectReleaseSerializer
@@ -113,6 +138,12 @@ class ProjectReleaseView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
     def put(self, request, *args, **kwargs):
         project_id = self.kwargs.get("id", None)
         project = Project.objects.get(id=project_id)
+        ingest = project.jobs.filter(kind='ingest').first()
+        if ingest is not None and ingest.is_stale:
+            requeue_ingest(project)
+            return Response({"detail": "Project file processing was lost and has been restarted"}, status=400)
+        if ingest is not None and ingest.status != 'finished':
+            return Response({"detail": "Project file is not processed yet"}, status=400)
         if project.project_status in ['unreleased', 'failed']:
             Project.objects.filter(id=project.id).update(status='verifying')
             return self.get(self, request, *args, **kwargs)
@@ -120,6 +151,31 @@ class ProjectReleaseView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
             return Response({"detail": "Not allowed here"}, status=400)
 
 
+class ProjectIngestView(generics.RetrieveAPIView):
+    """
+    get:
+        【任务管理】 获取任务文件的导入进度
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    serializer_class = JobSerializer
+    queryset = Project.objects.all()
+    lookup_field = 'id'
+
+    job_kind = 'ingest'
+
+    def get_object(self, *args, **kwargs):
+        project = super().get_object()
+        return get_object_or_404(Job, project=project, kind=self.job_kind)
+
+
+class ProjectExportView(ProjectIngestView):
+    """
+    get:
+        【任务管理】 获取结果文件的生成进度
+    """
+    job_kind = 'export'
+
+
 class ContributorsListView(generics.ListAPIView, mixins.UpdateModelMixin):
     """
     get:
@@ -225,7 +281,54 @@ class ProjectDeleteContributorsView(generics.ListAPIView, mixins.UpdateModelMixi
             return Response({"message": "User is NOT in the project!"}, status=400)
 
 
-class ProjectVerifyListView(generics.ListAPIView):
+class ProjectBulkContributorsView(generics.GenericAPIView):
+    """
+    post:
+        【成员管理】 批量添加或删除标注人
+            {"user_ids": [1, 2], "emails": ["someone@example.com"]}，返回每个用户的处理结果：
+            added / already_in（添加），removed / not_in（删除），not_found（用户不存在）
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    serializer_class = BulkContributorsSerializer
+    queryset = Project.objects.all()
+    lookup_field = 'id'
+    remove = False
+
+    def post(self, request, *args, **kwargs):
+        project = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+        emails = serializer.validated_data['emails']
+
+        # Emails match case-insensitively, as they do in MySQL's default collation.
+        users = User.objects.annotate(email_lower=Lower('email')).filter(
+            Q(id__in=user_ids) | Q(email_lower__in=[email.lower() for email in emails])
+        ).values_list('id', 'email_lower')
+        known_ids = set(user_id for user_id, email in users)
+        email_ids = {email: user_id for user_id, email in users}
+        resolved = [(user_id, user_id if user_id in known_ids else None) for user_id in user_ids]
+        resolved += [(email, email_ids.get(email.lower())) for email in emails]
+        targets = set(user_id for key, user_id in resolved if user_id is not None)
+        if self.remove:
+            changed = project.remove_contributors(targets)
+        else:
+            changed = project.add_contributors(targets)
+
+        results = []
+        for key, user_id in resolved:
+            if user_id is None:
+                outcome = 'not_found'
+            elif user_id in changed:
+                outcome = 'removed' if self.remove else 'added'
+                changed.discard(user_id)
+            else:
+                outcome = 'not_in' if self.remove else 'already_in'
+            results.append({"user": key, "user_id": user_id, "status": outcome})
+        return Response({"results": results}, status=200)
+
+
+class ProjectVerifyListView(ProjectListingMixin, generics.ListAPIView):
     """
     get:
         【任务审核】 获取状态为“审核中”or“已通过”or“未通过”的任务列表
@@ -305,6 +408,7 @@ class ProjectResultView(generics.ListAPIView):
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
     serializer_class = TaskResultSerializer
+    pagination_class = OptionalCursorPagination
 
     search_fields = ()
     ordering_fields = ('id', 'updated',)
@@ -313,7 +417,16 @@ class ProjectResultView(generics.ListAPIView):
     def get_queryset(self, *args, **kwargs):
         project_id = self.kwargs.get("id", None)
         project = get_object_or_404(Project, id=project_id)
-        return project.task_set.exclude(label='')
+        contributions = Contribution.objects.select_related('contributor')
+        return project.task_set.exclude(label='').select_related('inspection__inspector').prefetch_related(
+            Prefetch('contribution_set', queryset=contributions)
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            attach_contents(page)
+        return page
 
 
 class ProjectMyContributionView(generics.ListAPIView):
@@ -323,6 +436,7 @@ class ProjectMyContributionView(generics.ListAPIView):
     """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ContributeResultSerializer
+    pagination_class = OptionalCursorPagination
 
     search_fields = ()
     ordering_fields = ('id', 'created', 'updated',)
@@ -362,40 +476,93 @@ class ProjectResultDownloadView(generics.RetrieveAPIView):
     """
     get:
         获取任务结果文件链接
+            stream: 为 true 时直接流式下载结果 CSV；否则结果文件未生成时在后台生成，进度见 export 接口
+            export_format: 流式下载的格式，csv、csv.gz、jsonl 或 jsonl.gz
     """
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
     serializer_class = ProjectResultURLSerializer
+    queryset = Project.objects.all()
     lookup_field = 'id'
 
-    def create_result_file(self, instance):
-        try:
-            file_name = '%s_%s_%s_result.csv' % (instance.id, instance.name, instance.project_type)
-            instance.result_file.save(file_name, ContentFile('RESULT'))
-            f = open(os.path.join(settings.RESULT_ROOT, file_name), mode='w', encoding='utf-8', newline='')
-            queryset = instance.task_set.all()
-
-            for i, obj in enumerate(queryset):
-                path = obj.file_path
-                reader = csv.DictReader(open(path, encoding='utf-8'))
-                fieldnames = reader.fieldnames
-                fieldnames.append('label')
-                if i == 0:
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                for row in reader:
-                    row['label'] = obj.label
-                    writer.writerow(row)
-        except:
-            #instance.result_file.delete()
-            return Response({"message": "Fail to create result file!"}, status=400)
-
     def get(self, request, *args, **kwargs):
-        project_id = self.kwargs.get("id", None)
-        project = get_object_or_404(Project, id=project_id)
+        project = self.get_object()
         if project.project_status == 'completed':
+            export_format = request.GET.get("export_format")
+            if request.GET.get("stream") == 'true' or export_format:
+                export_format = export_format or 'csv'
+                if export_format not in EXPORT_FORMATS:
+                    return Response({"message": "Unknown export format"}, status=400)
+                chunks, content_type, file_name = export_stream(project, export_format)
+                response = StreamingHttpResponse(chunks, content_type=content_type)
+                response['Content-Disposition'] = 'attachment; filename="%s"' % file_name
+                return response
             if not project.result_file:
-                self.create_result_file(project)
+                job = start_export(project)
+                return Response({"message": "Result file is being created", "job": JobSerializer(job).data}, status=202)
             serializer = self.get_serializer(project)
             return Response(serializer.data)
         else:
             return Response({"message": "Project is not completed"}, status=400)
+
+
+class ProjectResultDeltaView(generics.RetrieveAPIView):
+    """
+    get:
+        【任务管理】 获取自水位线以来标签有变化的任务结果
+            since: 上次返回的 watermark，为空时从头开始
+            limit: 每次最多返回的任务数，默认且最多为1000
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    queryset = Project.objects.all()
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        project = self.get_object()
+        if project.project_status not in ['answering', 'checking', 'completed']:
+            return Response({"message": "Project has no results yet"}, status=400)
+        try:
+            since = request.GET.get("since")
+            watermark = parse_watermark(since) if since else None
+            limit = min(int(request.GET.get("limit", EXPORT_CHUNK_SIZE)), EXPORT_CHUNK_SIZE)
+        except ValueError:
+            return Response({"message": "Invalid watermark or limit"}, status=400)
+        if limit < 1:
+            return Response({"message": "Invalid watermark or limit"}, status=400)
+        tasks, more = changed_since(project, watermark, limit)
+        return Response({
+            "results": [result_record(task) for task in tasks],
+            "watermark": format_watermark(tasks[-1]) if tasks else since,
+            "more": more,
+        })
+
+
+class ProjectResultFileView(generics.RetrieveAPIView):
+    """
+    get:
+        【任务管理】 下载任务结果文件
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    queryset = Project.objects.all()
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        project = self.get_object()
+        if not project.result_file:
+            return Response({"message": "Result file is not ready"}, status=404)
+        return send_file(project.result_file.path)
+
+
+class ProjectFileView(generics.RetrieveAPIView):
+    """
+    get:
+        【任务管理】 下载任务原始文件
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    queryset = Project.objects.all()
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        project = self.get_object()
+        if not project.project_file:
+            return Response({"message": "Project has no file"}, status=404)
+        return send_file(project.project_file.path)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Recount the task, contribution and submitted counters of projects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int, help='Projects to rebuild, all if omitted')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['project_ids']:
+            projects = projects.filter(id__in=options['project_ids'])
+        for project in projects.only('id'):
+            project.rebuild_counters()
+        self.stdout.write('Rebuilt counters of %d projects' % projects.count())
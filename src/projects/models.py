@@ -1,7 +1,9 @@
 import os
 import re
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Count, Exists, IntegerField, OuterRef, Subquery, Value, BooleanField
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.dispatch import receiver
 from django.db.models.signals import pre_save, post_save
@@ -9,7 +11,7 @@ from django.contrib.auth import get_user_model
 from django.core.files.storage import FileSystemStorage
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from annotation.utils import get_filename_ext, random_string_generator
+from annotation.utils import CounterFieldsMixin, get_filename_ext, random_string_generator
 from targets.models import Target, TargetType
 from tags.models import Tag
 from quizzes.models import Quiz, QuestionType
@@ -28,6 +30,9 @@ def upload_project_file_path(instance, filename):
     return final_filename
 
 
+COUNTER_FIELDS = ('task_count', 'contribution_count', 'submitted_count')
+
+
 class Status(models.Model):
     id = models.IntegerField()
     project_status = models.CharField(max_length=128, primary_key=True)
@@ -39,7 +44,33 @@ class Status(models.Model):
         return str(self.project_status)
 
 
-class Project(models.Model):
+class ProjectQuerySet(models.QuerySet):
+    def for_listing(self, user):
+        """
+        Load everything ProjectSerializer renders in a fixed number of queries,
+        with `is_in` and `my_quantity` for `user` computed as subqueries.
+        """
+        from tasks.models import Contribution
+
+        queryset = self.select_related(
+            'project_type', 'quiz', 'project_target__type'
+        ).prefetch_related('tags', 'contributors')
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_in=Value(False, output_field=BooleanField()),
+                my_quantity=Value(0, output_field=IntegerField()),
+            )
+        memberships = Project.contributors.through.objects.filter(project=OuterRef('pk'), user=user)
+        labelled = Contribution.objects.filter(
+            project=OuterRef('pk'), contributor=user
+        ).exclude(label='').order_by().values('project').annotate(count=Count('id')).values('count')
+        return queryset.annotate(
+            is_in=Exists(memberships),
+            my_quantity=Coalesce(Subquery(labelled, output_field=IntegerField()), 0),
+        )
+
+
+class Project(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=128, default='unnamed_project')
     tags = models.ManyToManyField(Tag, blank=True, related_name='tagged_projects')
     project_type = models.ForeignKey(QuestionType, related_name='related_projects')
@@ -69,6 +100,9 @@ class Project(models.Model):
         null=True,
     )
     is_file_changed = models.BooleanField(default=False)
+    task_count = models.IntegerField(default=0)
+    contribution_count = models.IntegerField(default=0)
+    submitted_count = models.IntegerField(default=0)
     updated = models.DateTimeField(auto_now=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     result_file = models.FileField(
@@ -77,6 +111,9 @@ class Project(models.Model):
         null=True,
     )
 
+    objects = ProjectQuerySet.as_manager()
+    counter_fields = COUNTER_FIELDS
+
     def __str__(self):
         return str(self.id) + '_' + str(self.project_type)
 
@@ -90,11 +127,11 @@ class Project(models.Model):
 
     @property
     def quantity(self):
-        return self.task_set.count()
+        return self.task_count
 
     @property
     def copies(self):
-        return self.contribution_set.count()
+        return self.contribution_count
 
     @property
     def project_status(self):
@@ -106,23 +143,116 @@ class Project(models.Model):
 
     @property
     def progress(self):
-        if self.copies != 0:
-            total = self.copies
-            completed = self.contribution_set.filter(submitted=True).count()
-            return '%d%%' % (completed/total*100)
+        if self.contribution_count != 0:
+            return '%d%%' % (self.submitted_count/self.contribution_count*100)
         return '0%'
 
+    def rebuild_counters(self):
+        Project.objects.filter(id=self.id).update(
+            task_count=self.task_set.count(),
+            contribution_count=self.contribution_set.count(),
+            submitted_count=self.contribution_set.filter(submitted=True).count(),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded contributor list, so saves that leave it alone skip the sync.
+        instance._loaded_contributors_char = instance.__dict__.get('contributors_char')
+        return instance
+
+    @property
+    def contributors_changed(self):
+        return self.contributors_char != getattr(self, '_loaded_contributors_char', None)
+
     def update_contributors(self):
-        for contributor in self.contributors.all():
-            self.contributors.remove(contributor)
-        contributors_list = re.findall('\d+', self.contributors_char)
-        for contributor in contributors_list:
-            contributor = User.objects.get(id=int(contributor))
-            self.contributors.add(contributor)
+        """
+        Make the contributors match `contributors_char` by inserting and deleting only the
+        difference in the through table. Ids of missing users are skipped and returned.
+        """
+        wanted = set(parse_contributor_ids(self.contributors_char))
+        unknown = unknown_user_ids(wanted)
+        known = wanted - set(unknown)
+        through = Project.contributors.through
+        current = set(through.objects.filter(project_id=self.id).values_list('user_id', flat=True))
+        if current - known:
+            through.objects.filter(project_id=self.id, user_id__in=current - known).delete()
+        if known - current:
+            through.objects.bulk_create([
+                through(project_id=self.id, user_id=user_id) for user_id in known - current
+            ])
+        self._loaded_contributors_char = self.contributors_char
+        return unknown
+
+    def add_contributors(self, user_ids):
+        """
+        Add users to the contributors with one bulk INSERT, returning the ids that were not in yet.
+        """
+        through = Project.contributors.through
+        with transaction.atomic():
+            self.lock()
+            current = set(through.objects.filter(
+                project_id=self.id, user_id__in=user_ids
+            ).values_list('user_id', flat=True))
+            added = set(user_ids) - current
+            if added:
+                through.objects.bulk_create([through(project_id=self.id, user_id=user_id) for user_id in added])
+                self.save_contributors_char()
+        return added
+
+    def remove_contributors(self, user_ids):
+        """
+        Remove users from the contributors with one DELETE, returning the ids that were in.
+        """
+        through = Project.contributors.through
+        with transaction.atomic():
+            self.lock()
+            removed = set(through.objects.filter(
+                project_id=self.id, user_id__in=user_ids
+            ).values_list('user_id', flat=True))
+            if removed:
+                through.objects.filter(project_id=self.id, user_id__in=removed).delete()
+                self.save_contributors_char()
+        return removed
+
+    def lock(self):
+        list(Project.objects.select_for_update().filter(id=self.id).values_list('id'))
+
+    def save_contributors_char(self):
+        """
+        Write the current contributors back to `contributors_char`, so the next sync keeps them.
+        """
+        user_ids = sorted(Project.contributors.through.objects.filter(
+            project_id=self.id
+        ).values_list('user_id', flat=True))
+        self.contributors_char = self._loaded_contributors_char = ','.join(str(user_id) for user_id in user_ids)
+        Project.objects.filter(id=self.id).update(contributors_char=self.contributors_char)
+
+
+def parse_contributor_ids(contributors_char):
+    return [int(user_id) for user_id in re.findall(r'\d+', contributors_char or '')]
+
+
+def unknown_user_ids(user_ids):
+    """
+    The ids in `user_ids` that belong to no user, found with a single query.
+    """
+    user_ids = set(user_ids)
+    return sorted(user_ids - set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)))
+
+
+def add_to_counters(project_id, **deltas):
+    """
+    Atomically add to the counter columns of a project, e.g. add_to_counters(1, task_count=10).
+    """
+    deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if deltas:
+        Project.objects.filter(id=project_id).update(**deltas)
 
 
 @receiver(post_save, sender=Project)
-def project_updated_receiver(sender, instance, *args, **kwargs):
-    instance.update_contributors()
+def project_updated_receiver(sender, instance, created, *args, **kwargs):
+    if created or instance.contributors_changed:
+        instance.update_contributors()
 
 
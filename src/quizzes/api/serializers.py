@@ -1,17 +1,17 @@
-import csv
-
 from rest_framework import serializers
 
+from annotation.restconf.fields import ProtectedFileField
 from quizzes.models import Quiz, Question, Answer, QuizContributor
 from targets.api.serializers import TargetSerializer
 from tags.api.serializers import TagBriefSerializer
-from annotation.utils import get_filename_ext
 
 
 class QuizSerializer(serializers.ModelSerializer):
     tags_detail = serializers.SerializerMethodField(read_only=True)
     quiz_type_name = serializers.SerializerMethodField(read_only=True)
     target = serializers.SerializerMethodField(read_only=True)
+    quiz_file = ProtectedFileField('api-quizzes:file', required=False, allow_null=True)
+    label_file = ProtectedFileField('api-quizzes:file', query={'kind': 'label'}, required=False, allow_null=True)
 
     class Meta:
         model = Quiz
@@ -60,16 +60,7 @@ class QuestionSerializer(serializers.ModelSerializer):
         read_only_fields = ['quiz', 'label']
 
     def get_text_content(self, obj):
-        path = obj.file_path
-        name, ext = get_filename_ext(path)
-        if ext == '.csv':
-            reader = csv.DictReader(open(path, encoding='utf-8'))
-            for i, row in enumerate(reader):
-                if i == 0:
-                    content = row
-        else:
-            content = ''
-        return content
+        return obj.content
 
 
 class AnswerSerializer(serializers.ModelSerializer):
@@ -97,16 +88,7 @@ class AnswerSerializer(serializers.ModelSerializer):
         return TargetSerializer(target).data
 
     def get_text_content(self, obj):
-        path = obj.question.file_path
-        name, ext = get_filename_ext(path)
-        if ext == '.csv':
-            reader = csv.DictReader(open(path, encoding='utf-8'))
-            for i, row in enumerate(reader):
-                if i == 0:
-                    content = row
-        else:
-            content = ''
-        return content
+        return obj.question.content
 
 
 class QuizRecordSerializer(serializers.ModelSerializer):
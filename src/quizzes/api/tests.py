@@ -0,0 +1,94 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.reverse import reverse as api_reverse
+
+from quizzes.models import Quiz, Question, Answer, QuizContributor, QuestionType
+from targets.models import Target, TargetType
+
+
+User = get_user_model()
+
+
+class QuizAnswerAPITestCase(APITestCase):
+    def setUp(self):
+        self.founder = User.objects.create(email='founder@gmail.com', full_name='founder')
+        self.user = User.objects.create(email='user@gmail.com', full_name='user')
+        target_type = TargetType.objects.create(name='Classification', chinese_name='分类')
+        question_type = QuestionType.objects.create(name='TextClassification', chinese_name='文本分类', type=target_type)
+        target = Target.objects.create(user=self.founder, name='sentiment', type=target_type, description='')
+        self.quiz = Quiz.objects.create(name='quiz', quiz_type=question_type, quiz_target=target, founder=self.founder)
+        for label in ['positive', 'negative', 'positive', 'negative']:
+            Question.objects.create(quiz=self.quiz, file_path='question.txt', label=label)
+
+    def test_answering_keeps_counters(self):
+        self.client.force_authenticate(self.user)
+        answer_url = api_reverse('api-quizzes:answer', kwargs={'id': self.quiz.id})
+        self.assertEqual(self.client.get(answer_url).status_code, status.HTTP_200_OK)
+        qc = QuizContributor.objects.get(quiz=self.quiz, contributor=self.user)
+        self.assertEqual((qc.total, qc.answered, qc.progress), (4, 0, '0%'))
+
+        for i in range(4):
+            response = self.client.put(answer_url, {'label': 'positive'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            qc.refresh_from_db()
+            self.assertEqual(qc.answered, i + 1)
+        self.assertEqual(qc.correct, 2)
+        self.assertEqual(qc.status, 'completed')
+        self.assertEqual(float(qc.accuracy), 0.5)
+
+        qc.answer_set.update(label='')
+        qc.rebuild_counters()
+        qc.refresh_from_db()
+        self.assertEqual((qc.total, qc.answered, qc.correct), (4, 0, 0))
+
+    def test_uncounted_attempt_is_not_completed(self):
+        qc = QuizContributor.objects.create(quiz=self.quiz, contributor=self.user)
+        self.assertFalse(qc.is_completed)
+
+        QuizContributor.objects.filter(id=qc.id).update(total=4, answered=1)
+        qc.status = 'in progress'
+        qc.save()
+        qc.refresh_from_db()
+        self.assertEqual((qc.total, qc.answered), (4, 1))
+
+    def test_answer_sheet_is_one_insert(self):
+        self.client.force_authenticate(self.user)
+        answer_url = api_reverse('api-quizzes:answer', kwargs={'id': self.quiz.id})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(answer_url)
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT') and 'quizzes_answer' in query['sql']
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Answer.objects.filter(quiz_contributor__contributor=self.user).count(), 4)
+
+    def walk_records(self, ordering):
+        self.client.force_authenticate(self.founder)
+        url = api_reverse('api-quizzes:record-list', kwargs={'id': self.quiz.id})
+        url += '?cursor=&limit=2&ordering=%s' % ordering
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(record['id'] for record in response.data['results'])
+            url = response.data['next']
+        return ids, response.data['previous']
+
+    def test_record_cursor_pages_past_null_accuracy(self):
+        users = [User.objects.create(email='user_%d@gmail.com' % i, full_name='user_%d' % i) for i in range(4)]
+        graded = QuizContributor.objects.create(quiz=self.quiz, contributor=users[0], accuracy=0.5, status='completed')
+        ungraded = [QuizContributor.objects.create(quiz=self.quiz, contributor=user) for user in users[1:]]
+        ungraded_ids = [qc.id for qc in ungraded]
+
+        ids, previous = self.walk_records('accuracy')
+        self.assertEqual(ids, [graded.id] + ungraded_ids)
+        ids, previous = self.walk_records('-accuracy')
+        self.assertEqual(ids, [graded.id] + ungraded_ids[::-1])
+
+        response = self.client.get(previous)
+        self.assertEqual([record['id'] for record in response.data['results']], [graded.id, ungraded_ids[2]])
+
@@ -6,6 +6,7 @@ from .views import (
     QuestionAPIView,
     AnswerAPIView,
     QuizRecordView,
+    QuizFileView,
 )
 
 
@@ -15,4 +16,5 @@ urlpatterns = [
     url(r'^(?P<id>\d+)/questions/$', QuestionAPIView.as_view(), name='question-list'),
     url(r'^(?P<id>\d+)/answer/$', AnswerAPIView.as_view(), name='answer'),
     url(r'^(?P<id>\d+)/records/', QuizRecordView.as_view(), name='record-list'),
+    url(r'^(?P<id>\d+)/file/$', QuizFileView.as_view(), name='file'),
 ]
@@ -10,6 +10,8 @@ from .serializers import (
     QuizRecordSerializer,
 )
 from accounts.api.permissions import IsOwner
+from annotation.sendfile import send_file
+from annotation.restconf.pagination import OptionalCursorPagination
 
 
 class QuizAPIView(mixins.CreateModelMixin, generics.ListAPIView):
@@ -82,18 +84,14 @@ class AnswerAPIView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
         quiz_id = self.kwargs.get("id", None)
         user = self.request.user
         qc = QuizContributor.objects.get(quiz_id=quiz_id, contributor=user)
-        spare_set = Answer.objects.filter(quiz_contributor=qc, label='')
-        if spare_set:
-            return spare_set.first()
-        return Answer.objects.none().first()
+        return Answer.objects.filter(quiz_contributor=qc, label='').select_related(
+            'question__quiz__quiz_target__type'
+        ).first()
 
     def get(self, request, *args, **kwargs):
         quiz_id = self.kwargs.get("id", None)
         quiz = get_object_or_404(Quiz, id=quiz_id)
-        user = request.user
-        if user not in quiz.contributors.all():
-            qc = QuizContributor(quiz=quiz, contributor=user)
-            qc.save()
+        QuizContributor.objects.get_or_create(quiz=quiz, contributor=request.user)
         instance = self.get_object()
         if instance:
             serializer = self.get_serializer(instance)
@@ -115,6 +113,7 @@ class QuizRecordView(generics.ListAPIView):
 
     permission_classes = [permissions.IsAuthenticated, ]
     serializer_class = QuizRecordSerializer
+    pagination_class = OptionalCursorPagination
 
     ordering_fields = ('accuracy', 'updated', 'status')
     filter_fields = ('status',)
@@ -123,3 +122,21 @@ class QuizRecordView(generics.ListAPIView):
         quiz_id = self.kwargs.get("id", None)
         quiz = get_object_or_404(Quiz, id=quiz_id)
         return quiz.quizcontributor_set.all()
+
+
+class QuizFileView(generics.RetrieveAPIView):
+    """
+    get:
+        【测试题管理】 下载测试题文件
+            kind: quiz 为题目文件（默认），label 为标签文件
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    queryset = Quiz.objects.all()
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        quiz = self.get_object()
+        quiz_file = quiz.label_file if request.GET.get("kind") == 'label' else quiz.quiz_file
+        if not quiz_file:
+            return Response({"message": "Quiz has no such file"}, status=404)
+        return send_file(quiz_file.path)
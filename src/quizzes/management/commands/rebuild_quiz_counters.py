@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from quizzes.models import QuizContributor
+
+
+class Command(BaseCommand):
+    help = 'Recount the total, answered and correct counters of quiz contributors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int, help='Quizzes to rebuild, all if omitted')
+
+    def handle(self, *args, **options):
+        quiz_contributors = QuizContributor.objects.all()
+        if options['quiz_ids']:
+            quiz_contributors = quiz_contributors.filter(quiz_id__in=options['quiz_ids'])
+        for quiz_contributor in quiz_contributors.only('id'):
+            quiz_contributor.rebuild_counters()
+        self.stdout.write('Rebuilt counters of %d quiz contributors' % quiz_contributors.count())
@@ -2,6 +2,7 @@ import os
 import csv
 
 from django.db import models
+from django.db.models import F
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.storage import FileSystemStorage
@@ -9,7 +10,8 @@ from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from annotation.utils import get_filename_ext, random_string_generator
+from annotation.utils import CounterFieldsMixin, get_filename_ext, random_string_generator
+from annotation.content import load_content
 from targets.models import Target, TargetType
 from tags.models import Tag
 
@@ -62,6 +64,10 @@ class Quiz(models.Model):
     def __str__(self):
         return str(self.id) + '_' + self.name
 
+    @property
+    def owner(self):
+        return self.founder
+
 
 class Question(models.Model):
     quiz = models.ForeignKey(Quiz)
@@ -72,8 +78,18 @@ class Question(models.Model):
     def __str__(self):
         return str(self.id) + '_' + self.quiz.name
 
+    @property
+    def content(self):
+        name, ext = get_filename_ext(self.file_path)
+        if ext == '.csv':
+            return load_content(self.file_path)
+        return ''
+
+
+QUIZ_COUNTER_FIELDS = ('total', 'answered', 'correct')
+
 
-class QuizContributor(models.Model):
+class QuizContributor(CounterFieldsMixin, models.Model):
     quiz = models.ForeignKey(Quiz)
     contributor = models.ForeignKey(User)
     accuracy = models.DecimalField(
@@ -81,30 +97,39 @@ class QuizContributor(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(1)]
     )
     status = models.CharField(max_length=255, blank=True, default='in progress')
+    total = models.IntegerField(default=0)
+    answered = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
     updated = models.DateTimeField(auto_now=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    counter_fields = QUIZ_COUNTER_FIELDS
+
     def __str__(self):
         return str(self.id) + '_' + str(self.quiz)
 
     @property
     def quantity(self):
-        return self.answer_set.count()
+        return self.total
 
     @property
     def is_completed(self):
-        if self.answer_set.filter(label=''):
-            return False
-        return True
+        # An attempt whose answer sheet has not been counted yet is not finished.
+        return 0 < self.total <= self.answered
 
     @property
     def progress(self):
-        num_of_answers = self.answer_set.count()
-        completed = self.answer_set.exclude(label='').count()
-        try:
-            return '%d%%' % (completed/num_of_answers*100)
-        except:
-            return '0%'
+        if self.total:
+            return '%d%%' % (self.answered/self.total*100)
+        return '0%'
+
+    def rebuild_counters(self):
+        answers = self.answer_set.exclude(label='')
+        QuizContributor.objects.filter(id=self.id).update(
+            total=self.answer_set.count(),
+            answered=answers.count(),
+            correct=answers.filter(label=F('question__label')).count(),
+        )
 
 
 class Answer(models.Model):
@@ -114,6 +139,13 @@ class Answer(models.Model):
     updated = models.DateTimeField(auto_now=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The saved label, so a save can move the counters of its quiz contributor by the difference.
+        instance._loaded_label = instance.__dict__.get('label', '')
+        return instance
+
 
 def create_questions(instance):
     name, ext = get_filename_ext(instance.quiz_file.name)
@@ -153,19 +185,33 @@ def create_questions_receiver(sender, instance, *args, **kwargs):
 @receiver(post_save, sender=QuizContributor)
 def create_answers_receiver(sender, instance, created, *args, **kwargs):
     if created:
-        for question in instance.quiz.question_set.all():
-            Answer.objects.create(quiz_contributor=instance, question=question)
+        # One INSERT for the whole sheet; bulk_create sends no post_save, and blank answers move no counter.
+        answers = [
+            Answer(quiz_contributor=instance, question_id=question_id)
+            for question_id in instance.quiz.question_set.values_list('id', flat=True)
+        ]
+        Answer.objects.bulk_create(answers)
+        QuizContributor.objects.filter(id=instance.id).update(total=len(answers))
+        instance.total = len(answers)
+
+
+def is_correct(label, question_label):
+    return label != '' and label == question_label
 
 
 @receiver(post_save, sender=Answer)
-def update_status_accuracy_receiver(sender, instance, *args, **kwargs):
-    qc = instance.quiz_contributor
-    if qc.is_completed:
-        qc.status = 'completed'
-        if not qc.accuracy:
-            good_answer = 0
-            for answer in Answer.objects.filter(quiz_contributor=qc):
-                if answer.label == answer.question.label:
-                    good_answer += 1
-            qc.accuracy = good_answer/qc.quantity
-        qc.save()
+def update_status_accuracy_receiver(sender, instance, created, *args, **kwargs):
+    old_label = '' if created else getattr(instance, '_loaded_label', '')
+    instance._loaded_label = instance.label
+    if old_label == instance.label:
+        return
+    question_label = instance.question.label
+    answered = bool(instance.label) - bool(old_label)
+    correct = is_correct(instance.label, question_label) - is_correct(old_label, question_label)
+    QuizContributor.objects.filter(id=instance.quiz_contributor_id).update(
+        answered=F('answered') + answered,
+        correct=F('correct') + correct,
+    )
+    qc = QuizContributor.objects.get(id=instance.quiz_contributor_id)
+    if qc.is_completed and qc.status != 'completed':
+        QuizContributor.objects.filter(id=qc.id).update(status='completed', accuracy=qc.correct/qc.total)
@@ -1,10 +1,7 @@
-import csv
-
 from rest_framework import serializers
 
-from tasks.models import Task, Contribution, Inspection
+from tasks.models import Task, Contribution, Inspection, Job
 from targets.api.serializers import TargetSerializer
-from annotation.utils import get_filename_ext
 
 
 class TaskContributeSerializer(serializers.ModelSerializer):
@@ -32,8 +29,9 @@ class TaskContributeSerializer(serializers.ModelSerializer):
             'contribution_id',
             'submitted',
             'label',
+            'lease_expires',
         ]
-        read_only_fields = ['id', 'contributor', 'created']
+        read_only_fields = ['id', 'contributor', 'created', 'lease_expires']
 
     def get_project_type(self, obj):
         return obj.project.project_type.name
@@ -43,38 +41,28 @@ class TaskContributeSerializer(serializers.ModelSerializer):
         return TargetSerializer(target).data
 
     def get_text_content(self, obj):
-        path = obj.task.file_path
-        name, ext = get_filename_ext(path)
-        if ext == '.csv':
-            reader = csv.DictReader(open(path, encoding='utf-8'))
-            for i, row in enumerate(reader):
-                if i == 0:
-                    content = row
-        else:
-            with open(path, 'r', encoding='utf-8') as file:
-                content = file.read().strip()
-        return content
+        return obj.task.content
 
     def get_contributor_name(self, obj):
         if obj.contributor:
             return obj.contributor.full_name
         return None
 
+    def get_neighbours(self, obj):
+        # Both ids come from one query, unless the queryset already annotated them.
+        if not hasattr(obj, 'previous_id'):
+            obj.previous_id = obj.next_id = None
+            if obj.contributor_id:
+                obj.previous_id, obj.next_id = Contribution.objects.with_neighbours().filter(
+                    id=obj.id
+                ).values_list('previous_id', 'next_id').get()
+        return obj.previous_id, obj.next_id
+
     def get_previous_id(self, obj):
-        if obj.contributor:
-            my_tasks = Contribution.objects.filter(project=obj.project, contributor=obj.contributor)
-            previous = my_tasks.filter(created__lt=obj.created).order_by('-created').first()
-            if previous:
-                return previous.id
-        return None
+        return self.get_neighbours(obj)[0]
 
     def get_next_id(self, obj):
-        if obj.contributor:
-            my_tasks = Contribution.objects.filter(project=obj.project, contributor=obj.contributor)
-            next_task = my_tasks.filter(created__gt=obj.created).order_by('created').first()
-            if next_task:
-                return next_task.id
-        return None
+        return self.get_neighbours(obj)[1]
 
 
 class TaskContributeUpdateSerializer(TaskContributeSerializer):
@@ -97,6 +85,24 @@ class TaskContributeUpdateSerializer(TaskContributeSerializer):
         read_only_fields = ['id', 'contributor', 'created', 'submitted']
 
 
+class ContributionCheckoutSerializer(TaskContributeSerializer):
+    class Meta:
+        model = Contribution
+        fields = [
+            'id',
+            'task',
+            'text_content',
+            'lease_expires',
+        ]
+        read_only_fields = ['id', 'task', 'lease_expires']
+
+
+class ContributionSubmitSerializer(serializers.Serializer):
+    contribution_id = serializers.IntegerField()
+    label = serializers.CharField(max_length=255)
+    submitted = serializers.BooleanField(default=False)
+
+
 class TaskInspectSerializer(serializers.ModelSerializer):
     project_type = serializers.SerializerMethodField(read_only=True)
     target = serializers.SerializerMethodField(read_only=True)
@@ -127,17 +133,7 @@ class TaskInspectSerializer(serializers.ModelSerializer):
         return TargetSerializer(target).data
 
     def get_text_content(self, obj):
-        path = obj.task.file_path
-        name, ext = get_filename_ext(path)
-        if ext == '.csv':
-            reader = csv.DictReader(open(path, encoding='utf-8'))
-            for i, row in enumerate(reader):
-                if i == 0:
-                    content = row
-        else:
-            with open(path, 'r', encoding='utf-8') as file:
-                content = file.read().strip()
-        return content
+        return obj.task.content
 
     def get_inspector_name(self, obj):
         try:
@@ -191,17 +187,7 @@ class TaskResultSerializer(serializers.ModelSerializer):
         ]
 
     def get_text_content(self, obj):
-        path = obj.file_path
-        name, ext = get_filename_ext(path)
-        if ext == '.csv':
-            reader = csv.DictReader(open(path, encoding='utf-8'))
-            for i, row in enumerate(reader):
-                if i == 0:
-                    content = row
-        else:
-            with open(path, 'r', encoding='utf-8') as file:
-                content = file.read().strip()
-        return content
+        return obj.content
 
     def get_inspection(self, obj):
         try:
@@ -211,3 +197,32 @@ class TaskResultSerializer(serializers.ModelSerializer):
 
     def get_contribution(self, obj):
         return ContributeResultSerializer(obj.contribution_set, many=True).data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField(read_only=True)
+    throughput = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id',
+            'project',
+            'kind',
+            'status',
+            'rows',
+            'total',
+            'errors',
+            'progress',
+            'throughput',
+            'message',
+            'started',
+            'finished',
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        return obj.progress
+
+    def get_throughput(self, obj):
+        return obj.throughput
@@ -0,0 +1,428 @@
+import os
+import csv
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.reverse import reverse as api_reverse
+
+from annotation import content
+from annotation.content import PACK_NAME, ContentCache, PackWriter, load_content, pack_path, read_packed
+from projects.models import Project, Status
+from quizzes.models import QuestionType
+from targets.models import Target, TargetType
+from tasks.models import (
+    Task, Contribution, ContributionManager, Inspection, Job, Vote,
+    attach_contents, finalize_due_submissions, run_ingest, submit_contributions,
+)
+from tasks.export import csv_lines, iter_result_records
+from tasks.api.views import ADVANCE_QUERY_BUDGET
+
+
+User = get_user_model()
+
+
+class ContributionAPITestCase(APITestCase):
+    def setUp(self):
+        self.founder = User.objects.create(email='founder@gmail.com', full_name='founder')
+        self.user_0 = User.objects.create(email='user_0@gmail.com', full_name='user_0')
+        self.user_1 = User.objects.create(email='user_1@gmail.com', full_name='user_1')
+        target_type = TargetType.objects.create(name='Classification', chinese_name='分类')
+        question_type = QuestionType.objects.create(name='TextClassification', chinese_name='文本分类', type=target_type)
+        target = Target.objects.create(user=self.founder, name='sentiment', type=target_type, description='')
+        Status.objects.create(
+            id=1,
+            project_status='answering',
+            project_status_name='进行中',
+            verify_status='passed',
+            verify_status_name='审核通过',
+        )
+        self.project = Project.objects.create(
+            project_type=question_type,
+            founder=self.founder,
+            project_target=target,
+            status=Status(pk='answering'),
+        )
+        self.media_dir = tempfile.mkdtemp()
+        for i in range(3):
+            file_path = os.path.join(self.media_dir, '%d.txt' % i)
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write('text %d' % i)
+            task = Task.objects.create(project=self.project, file_path=file_path, copy=2)
+            for copy in range(task.copy):
+                Contribution.objects.create(project=self.project, task=task)
+        self.project.rebuild_counters()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_dir)
+
+    def test_checkout_never_shares_a_contribution(self):
+        leased_0 = Contribution.objects.checkout(self.project.id, self.user_0, size=3)
+        leased_1 = Contribution.objects.checkout(self.project.id, self.user_1, size=3)
+        ids_0 = set(contribution.id for contribution in leased_0)
+        ids_1 = set(contribution.id for contribution in leased_1)
+        self.assertEqual(len(ids_0), 3)
+        self.assertEqual(len(ids_1), 3)
+        self.assertFalse(ids_0 & ids_1)
+
+    def test_checkout_never_leases_two_copies_of_a_task(self):
+        leased = Contribution.objects.checkout(self.project.id, self.user_0, size=6)
+        tasks = [contribution.task_id for contribution in leased]
+        self.assertEqual(len(tasks), len(set(tasks)))
+        self.assertEqual(len(tasks), 3)
+
+    def test_checkout_falls_back_to_other_copies_after_a_lost_claim(self):
+        held = Contribution.objects.checkout(self.project.id, self.user_1, size=3)
+        free = set(self.project.contribution_set.filter(lease_owner__isnull=True).values_list('id', flat=True))
+
+        # Offer the copies leased to user_1 first, as a stale candidate SELECT would.
+        def stale_spare_for(manager, project_id, user, now):
+            return manager.filter(project=project_id, label='').order_by('lease_owner')
+
+        with mock.patch.object(ContributionManager, 'spare_for', stale_spare_for), \
+                mock.patch('tasks.models.random.shuffle'):
+            leased = Contribution.objects.checkout(self.project.id, self.user_0, size=3)
+        self.assertEqual(set(contribution.id for contribution in leased), free)
+        self.assertEqual(self.project.contribution_set.filter(lease_owner=self.user_1).count(), len(held))
+
+    def test_checkout_returns_held_lease_first(self):
+        first = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        again = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        self.assertEqual(first.id, again.id)
+
+    def test_checkout_api(self):
+        self.client.force_authenticate(self.user_0)
+        checkout_url = api_reverse('api-tasks:checkout', kwargs={'id': self.project.id})
+        response = self.client.post(checkout_url, {'size': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(response.data['target']['name'], 'sentiment')
+
+    def test_bulk_submit_settles_tasks(self):
+        submit_url = api_reverse('api-tasks:submit', kwargs={'id': self.project.id})
+        for user in [self.user_0, self.user_1]:
+            self.client.force_authenticate(user)
+            leased = Contribution.objects.checkout(self.project.id, user, size=3)
+            data = [
+                {'contribution_id': contribution.id, 'label': 'positive', 'submitted': True}
+                for contribution in leased
+            ]
+            response = self.client.post(submit_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['accepted']), 3)
+        self.assertEqual(self.project.task_set.filter(label='positive').count(), 3)
+
+    def test_bulk_submit_rejects_foreign_and_repeated_tasks(self):
+        submit_url = api_reverse('api-tasks:submit', kwargs={'id': self.project.id})
+        labelled = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        Contribution.objects.filter(id=labelled.id).update(label='positive', lease_owner=None)
+        self.client.force_authenticate(self.user_1)
+        response = self.client.post(submit_url, [{'contribution_id': labelled.id, 'label': 'negative'}], format='json')
+        self.assertEqual(response.data['rejected'], [labelled.id])
+        self.assertEqual(Contribution.objects.get(id=labelled.id).label, 'positive')
+
+        Contribution.objects.create(project=self.project, task_id=labelled.task_id)
+        copies = self.project.contribution_set.filter(task=labelled.task_id, label='')
+        copies.update(lease_owner=self.user_1, lease_expires=timezone.now() + timedelta(minutes=5))
+        data = [{'contribution_id': contribution.id, 'label': 'negative'} for contribution in copies]
+        response = self.client.post(submit_url, data, format='json')
+        self.assertEqual(len(response.data['accepted']), 1)
+        self.assertEqual(len(response.data['rejected']), 1)
+
+    def test_advance_query_budget(self):
+        self.client.force_authenticate(self.user_0)
+        current = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        advance_url = api_reverse('api-tasks:advance', kwargs={'id': self.project.id})
+        data = {'contribution_id': current.id, 'label': 'positive', 'submitted': True}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(advance_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(context.captured_queries), ADVANCE_QUERY_BUDGET)
+        self.assertNotEqual(response.data['task'], current.task_id)
+        self.assertTrue(response.data['text_content'].startswith('text'))
+
+    def test_advance_moves_on_when_a_claim_is_lost(self):
+        held = Contribution.objects.checkout(self.project.id, self.user_1, size=2)
+        held_ids = set(contribution.id for contribution in held)
+        self.client.force_authenticate(self.user_0)
+        current = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        advance_url = api_reverse('api-tasks:advance', kwargs={'id': self.project.id})
+        data = {'contribution_id': current.id, 'label': 'positive'}
+
+        # Offer rows already leased to user_1 first, as a stale candidate SELECT would.
+        def stale_spare_for(manager, project_id, user, now):
+            return manager.filter(project=project_id, label='').exclude(task=current.task_id).order_by('lease_owner')
+
+        with mock.patch.object(ContributionManager, 'spare_for', stale_spare_for), \
+                mock.patch('tasks.models.random.shuffle'):
+            response = self.client.post(advance_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(response.data['id'], held_ids)
+        self.assertEqual(
+            set(Contribution.objects.filter(lease_owner=self.user_1).values_list('id', flat=True)), held_ids
+        )
+        self.assertEqual(Contribution.objects.get(id=response.data['id']).lease_owner, self.user_0)
+
+    def test_advance_rejects_foreign_lease(self):
+        current = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        self.client.force_authenticate(self.user_1)
+        advance_url = api_reverse('api-tasks:advance', kwargs={'id': self.project.id})
+        data = {'contribution_id': current.id, 'label': 'positive'}
+        response = self.client.post(advance_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tied_votes_open_inspection(self):
+        for user, label in [(self.user_0, 'positive'), (self.user_1, 'negative')]:
+            leased = Contribution.objects.checkout(self.project.id, user, size=3)
+            ids = [contribution.id for contribution in leased]
+            Contribution.objects.filter(id__in=ids).update(label=label, contributor=user)
+            submit_contributions(ids)
+        self.assertEqual(Inspection.objects.filter(project=self.project).count(), 3)
+        self.assertFalse(self.project.task_set.exclude(label='').exists())
+
+    def test_sweep_submits_due_contributions(self):
+        first, second = self.project.task_set.order_by('id')[:2]
+        past = timezone.now() - timedelta(seconds=1)
+        for user, contribution in zip([self.user_0, self.user_1], first.contribution_set.all()):
+            Contribution.objects.filter(id=contribution.id).update(label='positive', contributor=user, submit_due=past)
+        pending = second.contribution_set.first()
+        Contribution.objects.filter(id=pending.id).update(
+            label='negative', contributor=self.user_0, submit_due=timezone.now() + timedelta(minutes=5)
+        )
+
+        self.assertEqual(finalize_due_submissions(), 2)
+        self.assertEqual(first.contribution_set.filter(submitted=True, submit_due=None).count(), 2)
+        self.assertFalse(Contribution.objects.get(id=pending.id).submitted)
+        self.assertEqual(Vote.objects.get(task=first, label='positive').count, 2)
+        self.assertEqual(Task.objects.get(id=first.id).label, 'positive')
+        self.assertEqual(Task.objects.get(id=second.id).label, '')
+        self.assertEqual(Project.objects.get(id=self.project.id).submitted_count, 2)
+
+    def test_sweep_submits_due_inspections(self):
+        task = self.project.task_set.first()
+        inspection = Inspection.objects.create(project=self.project, task=task, label='negative', inspector=self.founder)
+        # Saving a label always opens a fresh grace window, so move its end into the past directly.
+        Inspection.objects.filter(id=inspection.id).update(submit_due=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(finalize_due_submissions(), 1)
+        self.assertTrue(Inspection.objects.get(task=task).submitted)
+        self.assertEqual(Task.objects.get(id=task.id).label, 'negative')
+
+    def test_update_view_returns_neighbours(self):
+        leased = Contribution.objects.checkout(self.project.id, self.user_0, size=3)
+        now = timezone.now()
+        for i, contribution in enumerate(leased):
+            Contribution.objects.filter(id=contribution.id).update(
+                label='positive', contributor=self.user_0, created=now + timedelta(seconds=i)
+            )
+        self.client.force_authenticate(self.user_0)
+        update_url = api_reverse('api-tasks:update', kwargs={'id': leased[1].id})
+        response = self.client.get(update_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['previous_id'], leased[0].id)
+        self.assertEqual(response.data['next_id'], leased[2].id)
+
+    def test_contribute_put_keeps_another_users_label(self):
+        contribute_url = api_reverse('api-tasks:contribute', kwargs={'id': self.project.id})
+        current = Contribution.objects.checkout(self.project.id, self.user_0)[0]
+        self.client.force_authenticate(self.user_0)
+        self.client.put(contribute_url, {'contribution_id': current.id, 'label': 'positive'}, format='json')
+        self.client.force_authenticate(self.user_1)
+        response = self.client.put(contribute_url, {'contribution_id': current.id, 'label': 'negative'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        current.refresh_from_db()
+        self.assertEqual((current.label, current.contributor_id), ('positive', self.user_0.id))
+
+
+class IngestTestCase(APITestCase):
+    def setUp(self):
+        self.founder = User.objects.create(email='founder@gmail.com', full_name='founder')
+        target_type = TargetType.objects.create(name='Classification', chinese_name='分类')
+        self.question_type = QuestionType.objects.create(
+            name='TextClassification', chinese_name='文本分类', type=target_type
+        )
+        self.target = Target.objects.create(user=self.founder, name='sentiment', type=target_type, description='')
+        Status.objects.create(
+            id=1,
+            project_status='answering',
+            project_status_name='进行中',
+            verify_status='passed',
+            verify_status_name='审核通过',
+        )
+        self.media_dir = tempfile.mkdtemp()
+        self.media = override_settings(MEDIA_ROOT=self.media_dir)
+        self.media.enable()
+
+    def tearDown(self):
+        self.media.disable()
+        shutil.rmtree(self.media_dir)
+
+    def create_project(self, file_name, **kwargs):
+        return Project.objects.create(
+            project_type=self.question_type,
+            founder=self.founder,
+            project_target=self.target,
+            status=Status(pk='answering'),
+            project_file=file_name,
+            **kwargs
+        )
+
+    def write_csv(self, file_name, rows):
+        with open(os.path.join(self.media_dir, file_name), 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'text'])
+            writer.writerows(rows)
+
+    def test_ingest_in_batches_with_fractional_repetition(self):
+        self.write_csv('upload.csv', [[i, 'text %d' % i] for i in range(5)])
+        project = self.create_project('upload.csv', repetition_rate=Decimal('1.5'))
+        with mock.patch('tasks.models.INGEST_BATCH_SIZE', 2):
+            run_ingest(project.id)
+
+        project = Project.objects.get(id=project.id)
+        self.assertEqual(project.task_set.count(), 5)
+        self.assertEqual(project.task_set.filter(copy=2).count(), 2)
+        self.assertEqual(project.contribution_set.count(), 7)
+        self.assertEqual((project.task_count, project.contribution_count, project.submitted_count), (5, 7, 0))
+        job = Job.objects.get(project=project, kind='ingest')
+        self.assertEqual((job.status, job.rows, job.total, job.errors), ('finished', 5, 5, 0))
+
+    def test_ingested_csv_reads_back(self):
+        self.write_csv('upload.csv', [[i, 'text %d' % i] for i in range(3)])
+        project = self.create_project('upload.csv')
+        run_ingest(project.id)
+        tasks = list(project.task_set.order_by('id'))
+        self.assertEqual(set(task.file_path for task in tasks), {pack_path(os.path.join(self.media_dir, 'upload'))})
+        self.assertEqual([task.content['text'] for task in tasks], ['text 0', 'text 1', 'text 2'])
+        self.assertEqual([task.content['text'] for task in attach_contents(tasks)], ['text 0', 'text 1', 'text 2'])
+
+    def test_export_header_of_a_bom_prefixed_upload(self):
+        self.write_csv('upload.csv', [[i, 'text %d' % i] for i in range(2)])
+        project = self.create_project('upload.csv')
+        run_ingest(project.id)
+        lines = ''.join(csv_lines(iter_result_records(project))).splitlines()
+        self.assertEqual(lines[0], 'task_id,content_id,content_text,label,contributor_labels,inspection_label')
+        self.assertEqual(len(lines), 3)
+
+    def test_pack_task_content_moves_files_into_the_pack(self):
+        self.write_csv('legacy.csv', [])
+        project = self.create_project('legacy.csv')
+        directory = os.path.join(self.media_dir, 'legacy')
+        os.mkdir(directory)
+        tasks = []
+        for i in range(3):
+            path = os.path.join(directory, '%d.csv' % i)
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerows([['id', 'text'], [i, 'text %d' % i]])
+            tasks.append(Task.objects.create(project=project, file_path=path, copy=1))
+        before = [task.content for task in tasks]
+
+        call_command('pack_task_content', project.id, '--batch-size', '2', '--delete', stdout=StringIO())
+        tasks = list(project.task_set.order_by('id'))
+        self.assertEqual(set(task.file_path for task in tasks), {pack_path(directory)})
+        self.assertEqual([task.content for task in tasks], before)
+        self.assertEqual(os.listdir(directory), [PACK_NAME])
+
+
+class PackTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pack = pack_path(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_packed_records_read_back_after_the_pack_grows(self):
+        with PackWriter(self.pack) as writer:
+            first = writer.append({'id': '1', 'text': '猫'})
+        self.assertEqual(read_packed(self.pack, *first), {'id': '1', 'text': '猫'})
+        with PackWriter(self.pack) as writer:
+            second = writer.append({'id': '2', 'text': 'dog'})
+        self.assertEqual(read_packed(self.pack, *second), {'id': '2', 'text': 'dog'})
+        self.assertEqual(read_packed(self.pack, *first), {'id': '1', 'text': '猫'})
+
+    def test_task_content_follows_its_storage(self):
+        text_path = os.path.join(self.directory, 'task.txt')
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write('text\n')
+        with PackWriter(self.pack) as writer:
+            offset, length = writer.append({'id': '1', 'text': 'packed'})
+        self.assertEqual(Task(file_path=text_path).content, 'text')
+        packed = Task(file_path=self.pack, content_offset=offset, content_length=length)
+        self.assertEqual(packed.content, {'id': '1', 'text': 'packed'})
+
+    def test_open_packs_are_bounded(self):
+        packs = []
+        for i in range(3):
+            pack = os.path.join(self.directory, '%d.pack' % i)
+            with PackWriter(pack) as writer:
+                packs.append((pack,) + writer.append({'id': str(i)}))
+        with mock.patch('annotation.content.MAX_OPEN_PACKS', 2):
+            read_packed(*packs[0])
+            first = content._maps[packs[0][0]][0]
+            for i, pack in enumerate(packs[1:], 1):
+                self.assertEqual(read_packed(*pack), {'id': str(i)})
+        self.assertEqual(len(content._maps), 2)
+        self.assertNotIn(packs[0][0], content._maps)
+        self.assertTrue(first.closed)
+
+
+class ContentCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        content.cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text, mtime_ns):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def test_lru_stays_within_its_bound(self):
+        cache = ContentCache(2)
+        for key in 'abc':
+            cache.set(key, key.upper())
+        cache.get('c')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'B')
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'size': 2})
+
+    def test_loads_are_counted_and_follow_the_mtime(self):
+        path = self.write('task.txt', 'old', 10 ** 18)
+        self.assertEqual(load_content(path), 'old')
+        self.assertEqual(load_content(path), 'old')
+        self.assertEqual(content.cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+        self.write('task.txt', 'new', 2 * 10 ** 18)
+        self.assertEqual(load_content(path), 'new')
+
+    def test_packed_content_is_read_again_after_the_pack_changes(self):
+        pack = pack_path(self.directory)
+        with PackWriter(pack) as writer:
+            offset, length = writer.append({'text': 'old'})
+        os.utime(pack, ns=(10 ** 18, 10 ** 18))
+        self.assertEqual(load_content(pack, offset, length), {'text': 'old'})
+        with open(pack, 'wb') as f:
+            f.write(b'{"text": "new"}\n')
+        os.utime(pack, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+        self.assertEqual(load_content(pack, offset, len(b'{"text": "new"}')), {'text': 'new'})
+
+    def test_cached_rows_are_copied_out(self):
+        path = self.write('task.csv', 'id,text\n1,text\n', 10 ** 18)
+        row = load_content(path)
+        row['label'] = 'positive'
+        self.assertEqual(load_content(path), {'id': '1', 'text': 'text'})
+
@@ -1,10 +1,22 @@
 from django.conf.urls import url
 
-from .views import TaskContributeView, TaskInspectView, TaskContributeUpdateView
+from .views import (
+    TaskContributeView,
+    TaskCheckoutView,
+    TaskSubmitView,
+    TaskAdvanceView,
+    TaskInspectView,
+    TaskContributeUpdateView,
+    TaskFileView,
+)
 
 
 urlpatterns = [
     url(r'^(?P<id>\d+)/contribute/$', TaskContributeView.as_view(), name='contribute'),
+    url(r'^(?P<id>\d+)/checkout/$', TaskCheckoutView.as_view(), name='checkout'),
+    url(r'^(?P<id>\d+)/submit/$', TaskSubmitView.as_view(), name='submit'),
+    url(r'^(?P<id>\d+)/advance/$', TaskAdvanceView.as_view(), name='advance'),
     url(r'^(?P<id>\d+)/inspect/$', TaskInspectView.as_view(), name='inspect'),
     url(r'^update/(?P<id>\d+)/$', TaskContributeUpdateView.as_view(), name='update'),
+    url(r'^file/(?P<id>\d+)/$', TaskFileView.as_view(), name='file'),
 ]
@@ -1,5 +1,8 @@
-import random
+from collections import defaultdict
 
+from django.db import transaction
+from django.db.models import DateTimeField, Q, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 import django.utils.timezone as timezone
 
@@ -7,10 +10,48 @@ from rest_framework.response import Response
 from rest_framework import generics, mixins, permissions
 
 from projects.models import Project
-from tasks.models import Task, Contribution, Inspection
+from tasks.models import (
+    Task,
+    Contribution,
+    Inspection,
+    submit_contributions,
+    submit_due_time,
+    relabel_contribution,
+)
 from quizzes.models import QuizContributor
-from .serializers import TaskContributeSerializer, TaskInspectSerializer, TaskContributeUpdateSerializer
+from .serializers import (
+    TaskContributeSerializer,
+    TaskInspectSerializer,
+    TaskContributeUpdateSerializer,
+    ContributionCheckoutSerializer,
+    ContributionSubmitSerializer,
+)
+from targets.api.serializers import TargetSerializer
 from accounts.api.permissions import IsContributorOrReadOnly, HasContributed, IsInspectorOrReadOnly
+from annotation.sendfile import send_file
+
+
+MAX_CHECKOUT_SIZE = 50
+
+# Database queries allowed for one uncontended TaskAdvanceView request, next item included, authentication excluded
+ADVANCE_QUERY_BUDGET = 4
+
+
+def check_contribute_permission(project, user):
+    """
+    Return an error response if the user may not contribute to the project yet.
+    """
+    if project.verify_status != 'passed':
+        return Response({"message": "Project hasn't passed the verification yet."}, status=400)
+    if project.quiz_id:
+        qc = QuizContributor.objects.filter(quiz_id=project.quiz_id, contributor=user).first()
+        if qc is None:
+            return Response({"message": "Please do the quiz first."}, status=400)
+        if not qc.is_completed:
+            return Response({"message": "You have not finished the quiz yet."}, status=400)
+        if qc.accuracy < project.accuracy_requirement:
+            return Response({"message": "You have failed the quiz."}, status=400)
+    return None
 
 
 class TaskContributeView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
@@ -29,30 +70,17 @@ class TaskContributeView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
 
     def get_object(self, *args, **kwargs):
         project_id = self.kwargs.get("id", None)
-        user = self.request.user
-        user_con_set = Contribution.objects.filter(project=project_id, contributor=user)
-        tasks = user_con_set.values_list('task', flat=True)
-        spare_set = Contribution.objects.filter(project=project_id, label='').exclude(task__in=tasks)
-        if spare_set:
-            ids = spare_set.values_list('id', flat=True)
-            rand_id = random.sample(list(ids), 1)[0]
-            return spare_set.get(id=rand_id)
-        return Contribution.objects.none().first()
+        leased = Contribution.objects.checkout(project_id, self.request.user)
+        if leased:
+            return leased[0]
+        return None
 
     def get(self, request, *args, **kwargs):
         project_id = self.kwargs.get("id", None)
         project = get_object_or_404(Project, id=project_id)
-        if project.verify_status != 'passed':
-            return Response({"message": "Project hasn't passed the verification yet."}, status=400)
-        if project.quiz:
-            user = request.user
-            if user not in project.quiz.contributors.all():
-                return Response({"message": "Please do the quiz first."}, status=400)
-            qc = QuizContributor.objects.get(quiz=project.quiz, contributor=user)
-            if not qc.is_completed:
-                return Response({"message": "You have not finished the quiz yet."}, status=400)
-            if qc.accuracy < project.accuracy_requirement:
-                return Response({"message": "You have failed the quiz."}, status=400)
+        error = check_contribute_permission(project, request.user)
+        if error:
+            return error
         instance = self.get_object()
         if instance:
             serializer = self.get_serializer(instance)
@@ -63,22 +91,177 @@ class TaskContributeView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
         if request.data['label']:
             contribution_id = request.data.get("contribution_id")
             instance = get_object_or_404(Contribution, id=contribution_id)
+            if instance.lease_owner_id not in (None, request.user.id) and instance.lease_expires > timezone.now():
+                return Response({"message": "Contribution is checked out by another user."}, status=400)
+            if instance.submitted:
+                return Response({"message": "Contribution has already been submitted."}, status=400)
+            if instance.contributor_id not in (None, request.user.id):
+                return Response({"message": "Contribution has been answered by another user."}, status=400)
+            if Contribution.objects.filter(task=instance.task_id, contributor=request.user).exclude(id=instance.id).exists():
+                return Response({"message": "You have already answered this task."}, status=400)
             instance.label = request.data['label']
             instance.contributor = request.user
+            instance.lease_owner = None
+            instance.lease_expires = None
+            submitted = False
             try:
                 if request.data['submitted'] == 'true':
-                    instance.submitted = True
+                    submitted = True
             except:
                 pass
             if not instance.created:
                 instance.created = timezone.now()
             instance.save()
+            if submitted:
+                submit_contributions([instance.id])
         return self.get(request, *args, **kwargs)
 
     def patch(self, request, *args, **kwargs):
         return self.put(request, *args, **kwargs)
 
 
+class TaskCheckoutView(generics.GenericAPIView):
+    """
+    post:
+        【标注任务】 批量领取任务中该用户未解答的问题
+            size: 领取数量，默认为1，最多50；返回的问题在 lease_expires 之前为该用户保留
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ContributionCheckoutSerializer
+
+    def get_size(self):
+        try:
+            size = int(self.request.data.get("size", self.request.query_params.get("size", 1)))
+        except (TypeError, ValueError):
+            size = 1
+        return max(1, min(size, MAX_CHECKOUT_SIZE))
+
+    def post(self, request, *args, **kwargs):
+        project_id = self.kwargs.get("id", None)
+        queryset = Project.objects.select_related('status', 'project_type', 'project_target__type')
+        project = get_object_or_404(queryset, id=project_id)
+        error = check_contribute_permission(project, request.user)
+        if error:
+            return error
+        leased = Contribution.objects.checkout(project.id, request.user, size=self.get_size())
+        serializer = self.get_serializer(leased, many=True)
+        return Response({
+            "project_type": project.project_type.name,
+            "target": TargetSerializer(project.project_target).data,
+            "results": serializer.data,
+        })
+
+
+class TaskSubmitView(generics.GenericAPIView):
+    """
+    post:
+        【标注任务】 批量提交标签
+            [{"contribution_id": 1, "label": "cat", "submitted": true}, ...]
+            只接受该用户领取且未过期的问题，或该用户已作答但尚未提交的问题；
+            该用户已回答过的题目、或同一批次中重复的题目会被拒绝
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ContributionSubmitSerializer
+
+    def post(self, request, *args, **kwargs):
+        project_id = self.kwargs.get("id", None)
+        project = get_object_or_404(Project, id=project_id)
+        error = check_contribute_permission(project, request.user)
+        if error:
+            return error
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get("contributions", [])
+        serializer = self.get_serializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+        entries = {entry['contribution_id']: entry for entry in serializer.validated_data}
+
+        user = request.user
+        now = timezone.now()
+        submit_due = submit_due_time()
+        groups = defaultdict(list)
+        with transaction.atomic():
+            rows = list(Contribution.objects.filter(
+                project=project_id, id__in=entries.keys(), submitted=False
+            ).filter(
+                Q(lease_owner=user, lease_expires__gt=now) | Q(contributor=user)
+            ).select_for_update().order_by('id').values_list('id', 'task'))
+            # One answer per task and user: skip tasks answered through another copy, and repeats in the batch.
+            seen = set(Contribution.objects.filter(
+                task__in=[task_id for contribution_id, task_id in rows], contributor=user
+            ).exclude(id__in=[contribution_id for contribution_id, task_id in rows]).values_list('task', flat=True))
+            for contribution_id, task_id in rows:
+                if task_id in seen:
+                    continue
+                seen.add(task_id)
+                entry = entries[contribution_id]
+                groups[(entry['label'], entry['submitted'])].append(contribution_id)
+            for (label, is_submitted), ids in groups.items():
+                Contribution.objects.filter(id__in=ids).update(
+                    label=label,
+                    contributor=user,
+                    lease_owner=None,
+                    lease_expires=None,
+                    submit_due=submit_due,
+                    created=Coalesce('created', Value(now, output_field=DateTimeField())),
+                    updated=now,
+                )
+
+        submitted, pending = [], []
+        for (label, is_submitted), ids in groups.items():
+            (submitted if is_submitted else pending).extend(ids)
+        if submitted:
+            submit_contributions(submitted)
+        accepted = submitted + pending
+        return Response({
+            "accepted": sorted(accepted),
+            "rejected": sorted(set(entries) - set(accepted)),
+        })
+
+
+class TaskAdvanceView(generics.GenericAPIView):
+    """
+    post:
+        【标注任务】 提交当前问题的标签，并领取下一道问题
+            contribution_id: 当前问题id，须由该用户领取
+            label: 标签，非空
+            submitted: 是否放弃修改窗口；为 true 时答案会在下一次后台提交（数秒内）中提交，而不是在本请求中
+            领取下一题没有竞争时，整个请求最多执行 ADVANCE_QUERY_BUDGET 次数据库查询（不含身份认证）；
+            项目与测试题的校验已在领取时完成
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ContributionCheckoutSerializer
+
+    def post(self, request, *args, **kwargs):
+        project_id = self.kwargs.get("id", None)
+        entry = ContributionSubmitSerializer(data=request.data)
+        entry.is_valid(raise_exception=True)
+        contribution_id = entry.validated_data['contribution_id']
+        submitted = entry.validated_data['submitted']
+
+        user = request.user
+        now = timezone.now()
+        updated = Contribution.objects.filter(
+            id=contribution_id, project=project_id, submitted=False, lease_owner=user
+        ).update(
+            label=entry.validated_data['label'],
+            contributor=user,
+            lease_owner=None,
+            lease_expires=None,
+            submit_due=now if submitted else submit_due_time(),
+            created=Coalesce('created', Value(now, output_field=DateTimeField())),
+            updated=now,
+        )
+        if not updated:
+            return Response({"message": "Contribution is not checked out by you."}, status=400)
+
+        leased = Contribution.objects.checkout(project_id, user)
+        if leased:
+            serializer = self.get_serializer(leased[0])
+            return Response(serializer.data)
+        return Response({"message": "Contribution Completed"}, status=200)
+
+
 class TaskInspectView(generics.RetrieveAPIView, mixins.UpdateModelMixin):
     """
     get:
@@ -146,7 +329,9 @@ class TaskContributeUpdateView(generics.RetrieveUpdateAPIView):
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, HasContributed]
     serializer_class = TaskContributeUpdateSerializer
-    queryset = Contribution.objects.all()
+    queryset = Contribution.objects.with_neighbours().select_related(
+        'project__project_type', 'project__project_target__type', 'contributor', 'task'
+    )
     lookup_field = 'id'
 
     def put(self, request, *args, **kwargs):
@@ -157,3 +342,28 @@ class TaskContributeUpdateView(generics.RetrieveUpdateAPIView):
 
     def patch(self, request, *args, **kwargs):
         return self.put(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        old_label = serializer.instance.label
+        instance = serializer.save()
+        relabel_contribution(instance, old_label)
+
+
+class TaskFileView(generics.RetrieveAPIView):
+    """
+    get:
+        【标注任务】 下载题目的原始文件，仅限任务创建者、审核者和领取或解答过该题的标注者
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = Task.objects.select_related('project')
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        task = self.get_object()
+        user = request.user
+        if user.id not in (task.project.founder_id, task.project.inspector_id):
+            if not task.contribution_set.filter(Q(contributor=user) | Q(lease_owner=user)).exists():
+                return Response({"message": "You have no access to this task."}, status=403)
+        if task.content_offset is not None:
+            return Response({"message": "Task content is only available through the API."}, status=404)
+        return send_file(task.file_path)
@@ -0,0 +1,232 @@
+import os
+import csv
+import json
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from projects.models import Project
+from tasks.models import Contribution, Job, attach_contents
+from tasks.tasks import export_results
+
+
+EXPORT_CHUNK_SIZE = 1000
+
+CONTENT_COLUMN_PREFIX = 'content_'
+
+# Labels written less than this long ago are held back from deltas, so a transaction that
+# commits after a poll cannot slip in behind the watermark that poll returned.
+DELTA_LAG_SECONDS = 5
+
+
+def iter_task_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Walk a task queryset in id order, `chunk_size` tasks at a time with their contents loaded.
+    Each chunk is a keyed range scan, so memory stays bounded by the chunk and not the project.
+    """
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            return
+        yield attach_contents(chunk)
+        last_id = chunk[-1].id
+
+
+def result_tasks(project):
+    """
+    Tasks of a project with everything a result record needs joined or prefetched.
+    """
+    contributions = Contribution.objects.exclude(label='').only('task', 'contributor', 'label')
+    return project.task_set.select_related('inspection').prefetch_related(
+        Prefetch('contribution_set', queryset=contributions)
+    )
+
+
+def result_record(task):
+    """
+    One task's result: its id, content, final label, the label of every contributor and the inspection label.
+    """
+    try:
+        inspection_label = task.inspection.label
+    except ObjectDoesNotExist:
+        inspection_label = ''
+    return OrderedDict([
+        ('task_id', task.id),
+        ('content', task.content),
+        ('label', task.label),
+        ('contributor_labels', OrderedDict(
+            (str(contribution.contributor_id), contribution.label) for contribution in task.contribution_set.all()
+        )),
+        ('inspection_label', inspection_label),
+    ])
+
+
+def iter_result_records(project, chunks=None):
+    for chunk in chunks or iter_task_chunks(result_tasks(project)):
+        for task in chunk:
+            yield result_record(task)
+
+
+def csv_row(record):
+    """
+    Flatten a result record into one CSV row: content columns inline under CONTENT_COLUMN_PREFIX,
+    so they can never collide with the result columns, and contributor labels as JSON.
+    """
+    content = record['content']
+    if not isinstance(content, dict):
+        content = {'text': content}
+    row = OrderedDict([('task_id', record['task_id'])])
+    # Keys of rows ingested from a BOM-prefixed upload start with the byte-order mark.
+    row.update((CONTENT_COLUMN_PREFIX + key.lstrip('\ufeff'), value) for key, value in content.items())
+    row['label'] = record['label']
+    row['contributor_labels'] = json.dumps(record['contributor_labels'], ensure_ascii=False)
+    row['inspection_label'] = record['inspection_label']
+    return row
+
+
+class Echo(object):
+    """
+    File-like object whose write returns the value, so csv writers can feed a generator.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(records):
+    """
+    Render result records as CSV text. The header comes from the first row's keys.
+    """
+    writer = None
+    for record in records:
+        row = csv_row(record)
+        if writer is None:
+            fieldnames = list(row.keys())
+            writer = csv.DictWriter(Echo(), fieldnames=fieldnames, restval='', extrasaction='ignore')
+            yield writer.writerow(dict(zip(fieldnames, fieldnames)))
+        yield writer.writerow(row)
+
+
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def gzipped(lines):
+    """
+    Gzip a stream of text lines on the fly, yielding compressed bytes as they become available.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for line in lines:
+        data = compressor.compress(line.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# export_format: (line renderer, compressed, content type, file extension)
+EXPORT_FORMATS = {
+    'csv': (csv_lines, False, 'text/csv', '.csv'),
+    'csv.gz': (csv_lines, True, 'application/gzip', '.csv.gz'),
+    'jsonl': (jsonl_lines, False, 'application/x-ndjson', '.jsonl'),
+    'jsonl.gz': (jsonl_lines, True, 'application/gzip', '.jsonl.gz'),
+}
+
+
+def export_stream(project, export_format='csv'):
+    """
+    Stream the results of a project in `export_format`, returning (chunks, content type, file name).
+    """
+    render, compressed, content_type, ext = EXPORT_FORMATS[export_format]
+    chunks = render(iter_result_records(project))
+    if compressed:
+        chunks = gzipped(chunks)
+    return chunks, content_type, result_file_name(project, ext)
+
+
+def reporting(chunks, job):
+    """
+    Pass chunks through, reporting the number of tasks seen so far on `job`.
+    """
+    rows = 0
+    for chunk in chunks:
+        yield chunk
+        rows += len(chunk)
+        job.report(rows=rows)
+
+
+def result_file_name(project, ext='.csv'):
+    return '%s_%s_%s_result%s' % (project.id, project.name, project.project_type, ext)
+
+
+def start_export(project):
+    """
+    Queue a background export of the result file, unless one is already queued or running
+    and has not gone stale.
+    """
+    job, created = Job.objects.get_or_create(project=project, kind='export')
+    restarted = Job.objects.filter(id=job.id).inactive().update(
+        status='pending', rows=0, total=0, errors=0, message='', started=None, finished=None
+    )
+    if created or restarted:
+        transaction.on_commit(lambda: export_results.delay(project.id))
+    job.refresh_from_db()
+    return job
+
+
+def run_export(project_id):
+    """
+    Write the result file of a project in the background, tracking progress on its export job.
+    """
+    project = Project.objects.select_related('project_type').get(id=project_id)
+    job = Job.objects.get(project_id=project_id, kind='export')
+    job.report(status='running', started=timezone.now(), finished=None, rows=0, total=project.task_count, message='')
+    file_name = result_file_name(project)
+    path = os.path.join(settings.RESULT_ROOT, file_name)
+    try:
+        with open(path + '.part', mode='w', encoding='utf-8', newline='') as f:
+            chunks = reporting(iter_task_chunks(result_tasks(project)), job)
+            f.writelines(csv_lines(iter_result_records(project, chunks)))
+        os.replace(path + '.part', path)
+    except Exception as e:
+        job.report(status='failed', finished=timezone.now(), message=str(e))
+        raise
+    Project.objects.filter(id=project_id).update(result_file=file_name)
+    job.report(status='finished', finished=timezone.now())
+
+
+def format_watermark(task):
+    return '%s_%d' % (task.updated.isoformat(), task.id)
+
+
+def parse_watermark(value):
+    """
+    Split a watermark into (updated, task id), raising ValueError if it is malformed.
+    """
+    updated, task_id = value.rsplit('_', 1)
+    updated = parse_datetime(updated)
+    if updated is None:
+        raise ValueError('Invalid watermark %r' % value)
+    return updated, int(task_id)
+
+
+def changed_since(project, watermark=None, limit=EXPORT_CHUNK_SIZE):
+    """
+    Labelled tasks of a project updated after `watermark`, in (updated, id) order, with their
+    contents loaded. Returns (tasks, more), `more` telling whether another page is waiting.
+    """
+    queryset = result_tasks(project).exclude(label='').filter(
+        updated__lte=timezone.now() - timedelta(seconds=DELTA_LAG_SECONDS)
+    )
+    if watermark is not None:
+        updated, task_id = watermark
+        queryset = queryset.filter(Q(updated__gt=updated) | Q(updated=updated, id__gt=task_id))
+    tasks = list(queryset.order_by('updated', 'id')[:limit + 1])
+    return attach_contents(tasks[:limit]), len(tasks) > limit
@@ -0,0 +1,54 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from annotation.content import PackWriter, pack_path, read_file
+from annotation.utils import get_filename_ext
+from projects.models import Project
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Move the one-file-per-task content of CSV projects into a packed content store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int, help='Projects to pack, all if omitted')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delete', action='store_true', help='Delete the per-task files once packed')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.exclude(project_file='').exclude(project_file__isnull=True)
+        if options['project_ids']:
+            projects = projects.filter(id__in=options['project_ids'])
+        for project in projects:
+            name, ext = get_filename_ext(project.project_file.name)
+            if ext != '.csv':
+                continue
+            packed = self.pack(project, os.path.join(settings.MEDIA_ROOT, name), options)
+            self.stdout.write('Packed %d tasks of project %d' % (packed, project.id))
+
+    def pack(self, project, directory, options):
+        pack = pack_path(directory)
+        unpacked = Task.objects.filter(project=project, content_offset__isnull=True).order_by('id')
+        packed = 0
+        last_id = 0
+        while True:
+            tasks = list(unpacked.filter(id__gt=last_id).values_list('id', 'file_path')[:options['batch_size']])
+            if not tasks:
+                return packed
+            # Records are appended before the rows point at them, so an interrupted
+            # run leaves unreferenced bytes in the pack but never a broken task.
+            with PackWriter(pack) as writer:
+                locations = [(task_id, path, writer.append(read_file(path))) for task_id, path in tasks]
+            with transaction.atomic():
+                for task_id, path, (offset, length) in locations:
+                    Task.objects.filter(id=task_id).update(
+                        file_path=pack, content_offset=offset, content_length=length
+                    )
+            if options['delete']:
+                for task_id, path, location in locations:
+                    os.remove(path)
+            packed += len(tasks)
+            last_id = tasks[-1][0]
@@ -0,0 +1,37 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from projects.models import Project
+from tasks.models import Task, Contribution, Vote
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the vote tallies of tasks from their submitted contributions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int, help='Projects to rebuild, all if omitted')
+
+    def handle(self, *args, **options):
+        project_ids = options['project_ids'] or Project.objects.values_list('id', flat=True)
+        for project_id in project_ids:
+            with transaction.atomic():
+                self.rebuild(project_id)
+        self.stdout.write('Rebuilt vote tallies of %d projects' % len(project_ids))
+
+    def rebuild(self, project_id):
+        submitted = Contribution.objects.filter(project=project_id, submitted=True).exclude(label='')
+        tally = submitted.values('task', 'label').annotate(count=Count('id'))
+        Vote.objects.filter(task__project=project_id).delete()
+        Vote.objects.bulk_create(
+            [Vote(task_id=row['task'], label=row['label'], count=row['count']) for row in tally],
+            batch_size=1000,
+        )
+        by_count = defaultdict(list)
+        for row in submitted.values('task').annotate(count=Count('id')):
+            by_count[row['count']].append(row['task'])
+        Task.objects.filter(project=project_id).update(votes=0)
+        for count, task_ids in by_count.items():
+            Task.objects.filter(id__in=task_ids).update(votes=count)
@@ -1,22 +1,26 @@
 import os
 import csv
+import shutil
 import zipfile
 import random
-from collections import Counter
+from collections import Counter, defaultdict
 from celery import current_app
-from datetime import datetime, timedelta
+from datetime import timedelta
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.dispatch import receiver
 from django.db.models.signals import pre_save, post_save
 
-from projects.models import Project, Status
+from projects.models import Project, Status, add_to_counters
 from annotation.utils import get_filename_ext, random_string_generator
+from annotation.content import PackWriter, load_content, load_contents, pack_path
 
 
-from tasks.tasks import calling_submit
+from tasks.tasks import ingest_project
 
 
 User = get_user_model()
@@ -26,18 +30,148 @@ class Task(models.Model):
     project = models.ForeignKey(Project)
     copy = models.IntegerField(blank=True, null=True)
     file_path = models.CharField(max_length=255)
+    content_offset = models.BigIntegerField(blank=True, null=True)
+    content_length = models.IntegerField(blank=True, null=True)
     label = models.CharField(max_length=255, blank=True)
+    votes = models.IntegerField(default=0)
     updated = models.DateTimeField(auto_now=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        index_together = [
+            ('project', 'updated'),
+        ]
+
     def __str__(self):
         return str(self.project) + '_' + str(self.id)
 
     @property
     def is_done(self):
-        if self.contribution_set.filter(submitted=False):
-            return False
-        return True
+        return self.copy is not None and self.votes >= self.copy
+
+    @property
+    def content(self):
+        if hasattr(self, '_content'):
+            return self._content
+        return load_content(self.file_path, self.content_offset, self.content_length)
+
+
+class Vote(models.Model):
+    task = models.ForeignKey(Task)
+    label = models.CharField(max_length=255)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('task', 'label')
+
+    def __str__(self):
+        return str(self.task) + '_' + self.label
+
+
+CHECKOUT_WINDOW = 8
+
+INGEST_BATCH_SIZE = 1000
+
+
+def attach_contents(tasks):
+    """
+    Load the content of a page of tasks in one pass, so `task.content` no longer touches the disk.
+    """
+    contents = load_contents([(task.file_path, task.content_offset, task.content_length) for task in tasks])
+    for task, content in zip(tasks, contents):
+        task._content = content
+    return tasks
+
+
+def random_priority():
+    return random.randint(0, 2 ** 31 - 1)
+
+
+class ContributionManager(models.Manager):
+    def spare_for(self, project_id, user, now=None):
+        """
+        Unlabelled, unleased contributions of a project whose task the user has neither
+        answered nor checked out, in assignment order. Walking the (project, label, priority)
+        index means picking the head does not depend on the size of the project.
+        """
+        now = now or timezone.now()
+        taken = self.filter(task=OuterRef('task')).filter(
+            Q(contributor=user) | Q(lease_owner=user, lease_expires__gt=now)
+        )
+        return self.filter(project=project_id, label='').filter(
+            Q(lease_expires__isnull=True) | Q(lease_expires__lte=now)
+        ).annotate(taken=Exists(taken)).filter(taken=False).order_by('priority')
+
+    def checkout(self, project_id, user, size=1):
+        """
+        Lease up to `size` spare contributions to the user, leases already held first.
+        Rows are claimed with a conditional UPDATE, so a row can never be leased to two
+        annotators; losing a race simply moves on to the next candidate.
+        """
+        now = timezone.now()
+        expires = now + timedelta(seconds=settings.CONTRIBUTION_LEASE_SECONDS)
+        held = list(self.filter(
+            project=project_id, label='', lease_owner=user, lease_expires__gt=now
+        ).select_related('task')[:size])
+        need = size - len(held)
+        if need <= 0:
+            return held
+
+        # Shuffle a window from the head of the queue so concurrent annotators
+        # spread over different rows instead of racing for the same one.
+        candidates = list(self.spare_for(project_id, user, now).select_related('task')[:need * CHECKOUT_WINDOW])
+        random.shuffle(candidates)
+        picked = []
+        seen = set(contribution.task_id for contribution in held)
+        while need > 0 and candidates:
+            batch = []
+            batch_tasks = set()
+            deferred = []
+            while candidates and len(batch) < need:
+                contribution = candidates.pop()
+                if contribution.task_id in seen:
+                    continue
+                if contribution.task_id in batch_tasks:
+                    # Another copy is being claimed this round; keep this one in case that claim is lost.
+                    deferred.append(contribution)
+                    continue
+                batch_tasks.add(contribution.task_id)
+                batch.append(contribution)
+            candidates.extend(deferred)
+            if not batch:
+                break
+            ids = [contribution.id for contribution in batch]
+            # label='' too: a row labelled since the SELECT has had its lease cleared.
+            claimed = self.filter(id__in=ids, label='').filter(
+                Q(lease_expires__isnull=True) | Q(lease_expires__lte=now)
+            ).update(lease_owner=user, lease_expires=expires)
+            if claimed < len(ids):
+                won = set(self.filter(
+                    id__in=ids, lease_owner=user, lease_expires=expires
+                ).values_list('id', flat=True))
+                batch = [contribution for contribution in batch if contribution.id in won]
+            # Only a won claim uses up its task; after a lost one the other copies stay candidates.
+            for contribution in batch:
+                contribution.lease_owner = user
+                contribution.lease_expires = expires
+                seen.add(contribution.task_id)
+            picked.extend(batch)
+            need -= len(batch)
+        return held + picked
+
+    def release_expired(self):
+        return self.filter(lease_expires__lte=timezone.now()).update(lease_owner=None, lease_expires=None)
+
+    def with_neighbours(self):
+        """
+        Annotate previous_id and next_id: the contributor's neighbouring contributions in the
+        same project by `created`, each a single seek on the (project, contributor, created) index.
+        """
+        mine = self.filter(project=OuterRef('project'), contributor=OuterRef('contributor'))
+        return self.annotate(
+            previous_id=Subquery(mine.filter(created__lt=OuterRef('created')).order_by('-created').values('id')[:1]),
+            next_id=Subquery(mine.filter(created__gt=OuterRef('created')).order_by('created').values('id')[:1]),
+        )
 
 
 class Contribution(models.Model):
@@ -46,10 +180,22 @@ class Contribution(models.Model):
     label = models.CharField(max_length=255, blank=True)
     contributor = models.ForeignKey(User, blank=True, null=True)
     submitted = models.BooleanField(default=False)
+    priority = models.IntegerField(default=random_priority)
+    lease_owner = models.ForeignKey(User, blank=True, null=True, related_name='leased_contributions')
+    lease_expires = models.DateTimeField(blank=True, null=True, db_index=True)
+    submit_due = models.DateTimeField(blank=True, null=True, db_index=True)
     created = models.DateTimeField(null=True)
     updated = models.DateTimeField(auto_now=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = ContributionManager()
+
+    class Meta:
+        index_together = [
+            ('project', 'label', 'priority'),
+            ('project', 'contributor', 'created'),
+        ]
+
     def __str__(self):
         return str(self.task) + '_' + str(self.id)
 
@@ -60,6 +206,7 @@ class Inspection(models.Model):
     label = models.CharField(max_length=255, blank=True)
     inspector = models.ForeignKey(User, blank=True, null=True)
     submitted = models.BooleanField(default=False)
+    submit_due = models.DateTimeField(blank=True, null=True, db_index=True)
     created = models.DateTimeField(null=True)
     updated = models.DateTimeField(auto_now=True)
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -68,7 +215,130 @@ class Inspection(models.Model):
         return str(self.task) + '_' + str(self.id)
 
 
-def create_tasks(instance):
+JOB_STATUS = (
+    ('pending', '等待中'),
+    ('running', '进行中'),
+    ('finished', '已完成'),
+    ('failed', '失败'),
+)
+
+
+ACTIVE_JOB_STATUSES = ('pending', 'running')
+
+
+class JobQuerySet(models.QuerySet):
+    def stale_before(self):
+        return timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+
+    def active(self):
+        """
+        Jobs still queued or running that reported progress within JOB_STALE_SECONDS.
+        """
+        return self.filter(status__in=ACTIVE_JOB_STATUSES, updated__gt=self.stale_before())
+
+    def inactive(self):
+        """
+        Finished or failed jobs, and queued or running ones that stopped reporting: lost workers or messages.
+        """
+        return self.exclude(status__in=ACTIVE_JOB_STATUSES, updated__gt=self.stale_before())
+
+
+class Job(models.Model):
+    project = models.ForeignKey(Project, related_name='jobs')
+    kind = models.CharField(max_length=32)
+    status = models.CharField(max_length=32, choices=JOB_STATUS, default='pending')
+    rows = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    message = models.TextField(blank=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    updated = models.DateTimeField(auto_now=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('project', 'kind')
+
+    def __str__(self):
+        return str(self.project) + '_' + self.kind
+
+    @property
+    def progress(self):
+        if self.total:
+            return '%d%%' % (self.rows/self.total*100)
+        return '0%'
+
+    @property
+    def throughput(self):
+        if not self.started:
+            return 0.0
+        seconds = ((self.finished or timezone.now()) - self.started).total_seconds()
+        if seconds <= 0:
+            return 0.0
+        return round(self.rows/seconds, 1)
+
+    @property
+    def is_stale(self):
+        return self.status in ACTIVE_JOB_STATUSES and self.updated <= Job.objects.stale_before()
+
+    def report(self, **fields):
+        # update() skips auto_now, and `updated` is how a job shows it is still alive.
+        fields.setdefault('updated', timezone.now())
+        Job.objects.filter(id=self.id).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+def iter_csv_task_records(project_file_path, pack):
+    """
+    Append every row of a CSV upload to the project pack, yielding the Task fields
+    that locate it, or None for a row that cannot be used.
+    """
+    with open(project_file_path, encoding='utf-8') as project_file, PackWriter(pack) as writer:
+        for row in csv.DictReader(project_file):
+            if not row.get('\ufeffid'):
+                yield None
+                continue
+            offset, length = writer.append(row)
+            yield {'file_path': pack, 'content_offset': offset, 'content_length': length}
+
+
+def count_csv_rows(path):
+    """
+    Count the records of a CSV upload the same way iter_csv_task_records reads them.
+    """
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for row in csv.DictReader(f))
+
+
+def insert_tasks(instance, tasks, last_id):
+    """
+    Insert a batch of tasks and their contributions with two bulk INSERTs and return the
+    largest task id of the project. Ingest is the only writer of a project's tasks, so the
+    rows above `last_id` are exactly the ones just inserted.
+    """
+    Task.objects.bulk_create(tasks)
+    inserted = list(Task.objects.filter(project=instance, id__gt=last_id).order_by('id').values_list('id', 'copy'))
+    contributions = [
+        Contribution(project=instance, task_id=task_id)
+        for task_id, copy in inserted
+        for i in range(copy)
+    ]
+    Contribution.objects.bulk_create(contributions)
+    add_to_counters(instance.id, task_count=len(tasks), contribution_count=len(contributions))
+    if inserted:
+        return inserted[-1][0]
+    return last_id
+
+
+def create_tasks(instance, job=None):
+    """
+    Create the tasks of a project from its uploaded file, streaming the upload and
+    inserting in batches of INGEST_BATCH_SIZE. Progress is reported on `job` after every
+    batch. Return the number of tasks created.
+    """
     name, ext = get_filename_ext(instance.project_file.name)
     project_file_path = os.path.join(settings.MEDIA_ROOT, instance.project_file.name)
     project_file_dir = os.path.join(settings.MEDIA_ROOT, name)
@@ -83,44 +353,212 @@ def create_tasks(instance):
         final_project_file_path = project_file_path.encode('cp437').decode('gbk')
         os.rename(project_file_path, final_project_file_path)
         file_name_list = os.listdir(final_project_file_path)
-
-        for file_name in file_name_list:
-            Task.objects.create(
-                project=instance,
-                file_path=os.path.join(final_project_file_path, file_name),
-                copy=int(rr),
-            )
+        total = len(file_name_list)
+        items = (
+            {'file_path': os.path.join(final_project_file_path, file_name)}
+            for file_name in file_name_list
+        )
 
     elif ext == '.csv':
-        inner_dir_name = '%s' % instance.name
-        project_file_dir = os.path.join(project_file_dir, inner_dir_name)
-        os.mkdir(project_file_dir)
-        reader = csv.DictReader(open(project_file_path, encoding='utf-8'))
-
-        for row in reader:
-            file_name = '%s.csv' % row['\ufeffid']
-            final_project_file_path = os.path.join(project_file_dir, file_name)
-            f = open(final_project_file_path, 'w', newline='', encoding='utf-8')
-            writer = csv.DictWriter(f, dialect='excel', fieldnames=reader.fieldnames)
-            writer.writeheader()
-            writer.writerow(row)
-            Task.objects.create(
-                project=instance,
-                file_path=final_project_file_path,
-                copy=int(rr),
-            )
+        total = count_csv_rows(project_file_path)
+        items = iter_csv_task_records(project_file_path, pack_path(project_file_dir))
 
+    else:
+        return 0
+
+    if job:
+        job.report(total=total)
+    doubled = set()
     if 1 < rr < 2:
-        length = instance.task_set.count()
-        num = int((rr - 1) * length)
-        ids = instance.task_set.values_list("id", flat=True)
-        rand_list = random.sample(set(ids), num)
-        for i in rand_list:
-            Task.objects.filter(id=i).update(copy=2)
+        doubled = set(random.sample(range(total), int((rr - 1) * total)))
+
+    created = 0
+    errors = 0
+    last_id = 0
+    batch = []
+    for i, item in enumerate(items):
+        if item is None:
+            errors += 1
+            continue
+        batch.append(Task(project=instance, copy=2 if i in doubled else int(rr), **item))
+        if len(batch) == INGEST_BATCH_SIZE:
+            last_id = insert_tasks(instance, batch, last_id)
+            created += len(batch)
+            batch = []
+            if job:
+                job.report(rows=created + errors, errors=errors)
+    if batch:
+        insert_tasks(instance, batch, last_id)
+        created += len(batch)
+    if job:
+        job.report(rows=created + errors, errors=errors)
+    return created
+
+
+def run_ingest(project_id):
+    """
+    Create the tasks of a project in the background, tracking progress on its ingest job.
+    """
+    job = Job.objects.get(project_id=project_id, kind='ingest')
+    job.report(status='running', started=timezone.now(), finished=None, rows=0, errors=0, message='')
+    try:
+        create_tasks(Project.objects.get(id=project_id), job)
+    except Exception as e:
+        job.report(status='failed', finished=timezone.now(), message=str(e))
+        raise
+    job.report(status='finished', finished=timezone.now())
+
+
+def add_vote(task_id, label, delta=1):
+    """
+    Atomically add `delta` to the tally of `label` on a task.
+    """
+    if Vote.objects.filter(task_id=task_id, label=label).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            Vote.objects.create(task_id=task_id, label=label, count=delta)
+    except IntegrityError:
+        Vote.objects.filter(task_id=task_id, label=label).update(count=F('count') + delta)
+
+
+def settle_tasks(task_ids):
+    """
+    Decide the label of every task in `task_ids` that has all its votes from its tally,
+    opening an inspection on a tie, then update each affected project once.
+    """
+    done = list(Task.objects.filter(id__in=set(task_ids), votes__gte=F('copy')).values_list('id', flat=True))
+    if not done:
+        return
+
+    top_labels = defaultdict(list)
+    tally = Vote.objects.filter(task__in=done, count__gt=0).order_by('task', '-count')
+    for task_id, label, count in tally.values_list('task', 'label', 'count'):
+        if len(top_labels[task_id]) < 2:
+            top_labels[task_id].append((label, count))
+    decided = defaultdict(list)
+    tied = []
+    for task_id, top in top_labels.items():
+        if len(top) == 1 or top[0][1] != top[1][1]:
+            decided[top[0][0]].append(task_id)
+        else:
+            tied.append(task_id)
+
+    now = timezone.now()
+    for label, ids in decided.items():
+        Task.objects.filter(id__in=ids).update(label=label, updated=now)
+    if tied:
+        inspected = set(Inspection.objects.filter(task__in=tied).values_list('task', flat=True))
+        Inspection.objects.bulk_create([
+            Inspection(task_id=task_id, project_id=project_id)
+            for task_id, project_id in Task.objects.filter(id__in=tied).values_list('id', 'project')
+            if task_id not in inspected
+        ])
+
+    for project in Project.objects.filter(task__in=done).distinct():
+        settle_project(project)
+
+
+def settle_project(project):
+    if project.progress == '100%':
+        if project.task_set.filter(label=''):
+            Project.objects.filter(id=project.id).update(status='checking')
+        else:
+            project.status = Status(pk='completed')
+            project.save()
 
-    for task in Task.objects.filter(project=instance):
-        for copy in range(task.copy):
-            Contribution.objects.create(project=instance, task=task)
+
+def submit_contributions(ids):
+    """
+    Submit the labelled contributions in `ids` with one UPDATE, add them to the vote
+    tallies of their tasks and settle those tasks.
+    """
+    with transaction.atomic():
+        rows = Contribution.objects.filter(
+            id__in=ids, submitted=False
+        ).exclude(label='').select_for_update().values_list('id', 'project', 'task', 'label')
+        projects = Counter()
+        tasks = Counter()
+        votes = Counter()
+        submitted = []
+        for contribution_id, project_id, task_id, label in rows:
+            projects[project_id] += 1
+            tasks[task_id] += 1
+            votes[(task_id, label)] += 1
+            submitted.append(contribution_id)
+        if not submitted:
+            return
+        Contribution.objects.filter(id__in=submitted).update(submitted=True, submit_due=None)
+        for (task_id, label), count in votes.items():
+            add_vote(task_id, label, count)
+        by_count = defaultdict(list)
+        for task_id, count in tasks.items():
+            by_count[count].append(task_id)
+        for count, task_ids in by_count.items():
+            Task.objects.filter(id__in=task_ids).update(votes=F('votes') + count)
+        for project_id, count in projects.items():
+            add_to_counters(project_id, submitted_count=count)
+    settle_tasks(tasks.keys())
+
+
+def submit_inspections(ids):
+    """
+    Submit the labelled inspections in `ids` with one UPDATE, copy their labels onto
+    their tasks and update each affected project once.
+    """
+    with transaction.atomic():
+        rows = Inspection.objects.filter(
+            id__in=ids, submitted=False
+        ).exclude(label='').select_for_update().values_list('id', 'task', 'label')
+        submitted = []
+        labels = defaultdict(list)
+        for inspection_id, task_id, label in rows:
+            submitted.append(inspection_id)
+            labels[label].append(task_id)
+        if not submitted:
+            return
+        Inspection.objects.filter(id__in=submitted).update(submitted=True, submit_due=None)
+        now = timezone.now()
+        for label, task_ids in labels.items():
+            Task.objects.filter(id__in=task_ids).update(label=label, updated=now)
+    task_ids = [task_id for task_ids in labels.values() for task_id in task_ids]
+    for project in Project.objects.filter(task__in=task_ids).distinct():
+        settle_project(project)
+
+
+def finalize_due_submissions(batch_size=1000):
+    """
+    Submit every contribution and inspection whose grace window has passed, in
+    batches of `batch_size`. Run periodically by tasks.tasks.finalize_submissions.
+    """
+    now = timezone.now()
+    finalized = 0
+    for model, submit in [(Contribution, submit_contributions), (Inspection, submit_inspections)]:
+        due = model.objects.filter(submitted=False, submit_due__lte=now).exclude(label='')
+        while True:
+            ids = list(due.values_list('id', flat=True)[:batch_size])
+            if ids:
+                submit(ids)
+                finalized += len(ids)
+            if len(ids) < batch_size:
+                break
+    return finalized
+
+
+def submit_due_time():
+    return timezone.now() + timedelta(seconds=settings.SUBMIT_GRACE_SECONDS)
+
+
+def relabel_contribution(contribution, old_label):
+    """
+    Move the vote of an already submitted contribution to its new label and settle its task again.
+    """
+    if not contribution.submitted or contribution.label == old_label:
+        return
+    with transaction.atomic():
+        add_vote(contribution.task_id, old_label, -1)
+        add_vote(contribution.task_id, contribution.label)
+    settle_tasks([contribution.task_id])
 
 
 @receiver(pre_save, sender=Project)
@@ -129,6 +567,7 @@ def project_file_pre_receiver(sender, instance, **kwargs):
         obj = Project.objects.get(id=instance.id)
         if instance.project_file and (not instance.project_file.name == obj.project_file.name):
             obj.task_set.all().delete()
+            Project.objects.filter(id=obj.id).update(task_count=0, contribution_count=0, submitted_count=0)
             instance.is_file_changed = True
         else:
             instance.is_file_changed = False
@@ -137,40 +576,47 @@ def project_file_pre_receiver(sender, instance, **kwargs):
         pass
 
 
+def queue_ingest(project):
+    """
+    Reset the ingest job of a project and queue it once the current transaction commits.
+    """
+    Job.objects.update_or_create(project=project, kind='ingest', defaults={
+        'status': 'pending',
+        'rows': 0,
+        'total': 0,
+        'errors': 0,
+        'message': '',
+        'started': None,
+        'finished': None,
+    })
+    transaction.on_commit(lambda: ingest_project.delay(project.id))
+
+
+def requeue_ingest(project):
+    """
+    Start the ingest of a project over after its job was lost, dropping whatever it had created.
+    """
+    with transaction.atomic():
+        project.task_set.all().delete()
+        Project.objects.filter(id=project.id).update(task_count=0, contribution_count=0, submitted_count=0)
+        name, ext = get_filename_ext(project.project_file.name)
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, name), ignore_errors=True)
+        queue_ingest(project)
+
+
 @receiver(post_save, sender=Project)
 def project_file_post_receiver(sender, instance, created, *args, **kwargs):
     if (instance.is_file_changed or created) and instance.project_file:
-        create_tasks(instance)
-
-
-@receiver(post_save, sender=Contribution)
-def contribution_submit_receiver(sender, instance, *args, **kwargs):
-    if instance.label and not instance.submitted:
-        date = datetime.utcnow() + timedelta(seconds=5)  # days=1
-        calling_submit.apply_async((instance,), eta=date)
-
-
-@receiver(post_save, sender=Contribution)
-def contribution_updated_receiver(sender, instance, *args, **kwargs):
-    task = instance.task
-    if task.is_done:
-        labels = task.contribution_set.values_list('label', flat=True)
-        if len(set(labels)) == 1:
-            task.label = instance.label
-        else:
-            top_labels = Counter(labels).most_common(2)
-            if top_labels[0][1] != top_labels[1][1]:
-                task.label = top_labels[0][0]
-            else:
-                Inspection.objects.create(task=task, project=instance.project)
-        task.save()
+        queue_ingest(instance)
 
 
-@receiver(post_save, sender=Inspection)
-def inspection_submit_receiver(sender, instance, *args, **kwargs):
+@receiver(pre_save, sender=Contribution)
+@receiver(pre_save, sender=Inspection)
+def submit_due_receiver(sender, instance, *args, **kwargs):
     if instance.label and not instance.submitted:
-        date = datetime.utcnow() + timedelta(seconds=5)  # days=1
-        calling_submit.apply_async((instance,), eta=date)
+        instance.submit_due = submit_due_time()
+    else:
+        instance.submit_due = None
 
 
 @receiver(post_save, sender=Inspection)
@@ -183,13 +629,7 @@ def inspection_updated_receiver(sender, instance, *args, **kwargs):
 
 @receiver(post_save, sender=Task)
 def task_updated_receiver(sender, instance, *args, **kwargs):
-    project = instance.project
-    if project.progress == '100%':
-        if project.task_set.filter(label=''):
-            Project.objects.filter(id=project.id).update(status='checking')
-        else:
-            project.status = Status(pk='completed')
-            project.save()
+    settle_project(instance.project)
 
 
 
@@ -1,8 +1,25 @@
 from celery import task
 
 
-@task(name='tasks.tasks.calling_submit')
-def calling_submit(instance):
-    instance.submitted = True
-    instance.save()
+@task(name='tasks.tasks.ingest_project')
+def ingest_project(project_id):
+    from tasks.models import run_ingest
+    run_ingest(project_id)
 
+
+@task(name='tasks.tasks.export_results')
+def export_results(project_id):
+    from tasks.export import run_export
+    run_export(project_id)
+
+
+@task(name='tasks.tasks.finalize_submissions')
+def finalize_submissions():
+    from tasks.models import finalize_due_submissions
+    return finalize_due_submissions()
+
+
+@task(name='tasks.tasks.release_expired_leases')
+def release_expired_leases():
+    from tasks.models import Contribution
+    return Contribution.objects.release_expired()